@@ -0,0 +1,383 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+
+try:
+    import gurobipy
+    from gurobipy import GRB, LinExpr, quicksum
+except ImportError:
+    gurobipy = None
+
+try:
+    from docplex.mp.solution import SolveSolution
+except ImportError:
+    SolveSolution = None
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    from scipy.sparse import csr_matrix
+except ImportError:
+    milp = None
+
+
+_CPLEX_STATUS = {'OPTIMAL_SOLUTION': 'optimal', 'FEASIBLE_SOLUTION': 'feasible',
+                 'INFEASIBLE_SOLUTION': 'infeasible', 'INFEASIBLE_OR_UNBOUNDED_SOLUTION': 'infeasible',
+                 'UNBOUNDED_SOLUTION': 'unbounded'}
+_SCIPY_STATUS = {0: 'optimal', 2: 'infeasible', 3: 'unbounded'}
+
+
+class Backend:
+    """Interface between the epsilon-constraint engine and a solver.
+
+    An adapter wraps a model and its objectives, and exposes the few operations the engine needs: maximize an
+    objective (optionally augmented with the epsilon slacks), add a bounded constraint on an objective and update its
+    right-hand side in place, solve, and read the status, objective value and solution back.
+    """
+
+    def __init__(self, model, objectives):
+        self.model = model
+        self.objectives = objectives
+        self.slacks = {}
+
+    @property
+    def infinity(self) -> float:
+        return np.inf
+
+    def maximize(self, k: int, slack_weights: Dict[int, float] = None):
+        """Set the objective to ``objectives[k] + sum(slack_weights[h] * s[h])``, maximized."""
+        raise NotImplementedError
+
+    def add_bound(self, k: int, rhs: float):
+        """Add ``objectives[k] >= rhs`` and return its handle."""
+        raise NotImplementedError
+
+    def add_epsilon_constraint(self, k: int, rhs: float):
+        """Add a slack ``s[k] >= 0`` and ``objectives[k] - s[k] == rhs``, and return the constraint handle."""
+        raise NotImplementedError
+
+    def set_rhs(self, constraint, rhs: float):
+        raise NotImplementedError
+
+    def remove(self, constraints):
+        raise NotImplementedError
+
+    def solve(self) -> bool:
+        """Solve the model and return whether a feasible solution was found."""
+        raise NotImplementedError
+
+    @property
+    def status(self) -> str:
+        """Status of the last solve: 'optimal', 'feasible' (a solution was found but a limit stopped the solver before
+        proving it optimal), 'infeasible', 'unbounded' or 'other'. A solver that cannot tell infeasible from unbounded
+        reports 'infeasible': the payoff-table bounds keep every epsilon-constraint model bounded."""
+        raise NotImplementedError
+
+    @property
+    def objective_value(self) -> float:
+        raise NotImplementedError
+
+    def slack_values(self) -> Dict[int, float]:
+        raise NotImplementedError
+
+    def objective_values(self) -> List[float]:
+        """Values of every objective at the current solution."""
+        raise NotImplementedError
+
+    def values(self) -> np.ndarray:
+        """Values of all the variables of the model, ordered by variable index; the slacks come last."""
+        raise NotImplementedError
+
+    def set_start(self, values):
+        """Use ``values`` (as returned by :meth:`values`) as a starting solution, when the solver supports it."""
+        pass
+
+    def export(self, directory: str):
+        """Return a picklable spec from which :meth:`load` rebuilds a copy of the backend in another process."""
+        return self.model, self.objectives
+
+    @classmethod
+    def load(cls, spec):
+        model, objectives = spec
+        return cls(model, objectives)
+
+
+class GurobiBackend(Backend):
+
+    def __init__(self, model, objectives):
+        super().__init__(model, objectives)
+        model.update()
+        self.variables = model.getVars()
+
+    @property
+    def infinity(self) -> float:
+        return GRB.INFINITY
+
+    def maximize(self, k: int, slack_weights: Dict[int, float] = None):
+        objective = self.objectives[k]
+        if slack_weights:
+            objective = objective + quicksum(w * self.slacks[h] for h, w in slack_weights.items())
+        self.model.setObjective(objective, sense=GRB.MAXIMIZE)
+
+    # gurobi folds the constant of an expression into the right-hand side, so handles keep it next to the constraint
+
+    def add_bound(self, k: int, rhs: float):
+        # noinspection PyArgumentList
+        return self.model.addConstr(self.objectives[k] >= rhs), LinExpr(self.objectives[k]).getConstant()
+
+    def add_epsilon_constraint(self, k: int, rhs: float):
+        self.slacks[k] = self.model.addVar(name=f's[{k}]')
+        # noinspection PyArgumentList
+        return (self.model.addConstr(self.objectives[k] - self.slacks[k] == rhs),
+                LinExpr(self.objectives[k]).getConstant())
+
+    def set_rhs(self, constraint, rhs: float):
+        constraint, constant = constraint
+        constraint.RHS = rhs - constant
+
+    def remove(self, constraints):
+        self.model.remove([constraint for constraint, _ in constraints])
+
+    def solve(self) -> bool:
+        self.model.optimize()
+        return self.model.SolCount > 0
+
+    @property
+    def status(self) -> str:
+        if self.model.Status == GRB.OPTIMAL:
+            return 'optimal'
+        if self.model.SolCount > 0:
+            return 'feasible'
+        return {GRB.INFEASIBLE: 'infeasible', GRB.INF_OR_UNBD: 'infeasible',
+                GRB.UNBOUNDED: 'unbounded'}.get(self.model.Status, 'other')
+
+    @property
+    def objective_value(self) -> float:
+        return self.model.ObjVal
+
+    def slack_values(self) -> Dict[int, float]:
+        return {k: s.X for k, s in self.slacks.items()}
+
+    def objective_values(self) -> List[float]:
+        return [LinExpr(objective).getValue() for objective in self.objectives]
+
+    def values(self) -> np.ndarray:
+        return np.array(self.model.getAttr('X', self.model.getVars()))
+
+    def set_start(self, values):
+        self.model.setAttr('Start', self.variables, list(values[:len(self.variables)]))
+
+    def export(self, directory: str):
+        """Write the model to ``directory`` as MPS and parameter files; objectives are mapped by variable index."""
+        self.model.update()
+        model_path = os.path.join(directory, 'model.mps')
+        param_path = os.path.join(directory, 'model.prm')
+        self.model.write(model_path)
+        self.model.write(param_path)
+        terms = []
+        for objective in self.objectives:
+            objective = LinExpr(objective)
+            terms.append(([objective.getVar(i).index for i in range(objective.size())],
+                          [objective.getCoeff(i) for i in range(objective.size())],
+                          objective.getConstant()))
+        return model_path, param_path, terms
+
+    @classmethod
+    def load(cls, spec):
+        model_path, param_path, terms = spec
+        model = gurobipy.read(model_path)
+        model.read(param_path)
+        variables = model.getVars()
+        objectives = [LinExpr(coefficients, [variables[i] for i in indices]) + constant
+                      for indices, coefficients, constant in terms]
+        return cls(model, objectives)
+
+
+class CplexBackend(Backend):
+    """Adapter for docplex models; docplex models are picklable, so the default :meth:`export` is enough."""
+
+    def __init__(self, model, objectives):
+        super().__init__(model, objectives)
+        self.variables = list(model.iter_variables())
+        self.solution = None
+
+    @property
+    def infinity(self) -> float:
+        return self.model.infinity
+
+    def maximize(self, k: int, slack_weights: Dict[int, float] = None):
+        objective = self.objectives[k]
+        if slack_weights:
+            objective = objective + self.model.sum(w * self.slacks[h] for h, w in slack_weights.items())
+        self.model.maximize(objective)
+
+    def add_bound(self, k: int, rhs: float):
+        return self.model.add_constraint(self.objectives[k] >= rhs)
+
+    def add_epsilon_constraint(self, k: int, rhs: float):
+        self.slacks[k] = self.model.continuous_var(name=f's_{k}')
+        return self.model.add_constraint(self.objectives[k] - self.slacks[k] == rhs)
+
+    def set_rhs(self, constraint, rhs: float):
+        constraint.rhs = rhs
+
+    def remove(self, constraints):
+        self.model.remove(list(constraints))
+
+    def solve(self) -> bool:
+        self.solution = self.model.solve()
+        return self.solution is not None
+
+    @property
+    def status(self) -> str:
+        return _CPLEX_STATUS.get(self.model.solve_status.name, 'other')
+
+    @property
+    def objective_value(self) -> float:
+        return self.solution.get_objective_value()
+
+    def slack_values(self) -> Dict[int, float]:
+        return {k: s.solution_value for k, s in self.slacks.items()}
+
+    def objective_values(self) -> List[float]:
+        return [self.solution.get_value(objective) for objective in self.objectives]
+
+    def values(self) -> np.ndarray:
+        return np.array(self.solution.get_values(list(self.model.iter_variables())))
+
+    def set_start(self, values):
+        # MIP starts are ignored (with a warning) on continuous models, where CPLEX already reuses the previous basis
+        if self.model.number_of_binary_variables + self.model.number_of_integer_variables == 0:
+            return
+        self.model.clear_mip_starts()
+        self.model.add_mip_start(SolveSolution(self.model, dict(zip(self.variables, values))))
+
+
+class ScipyModel:
+    """A small mixed-integer linear model solved with ``scipy.optimize.milp`` (HiGHS).
+
+    It needs no commercial license, so the epsilon-constraint engine can be run and profiled anywhere. Variables are
+    referred to by their index, and linear expressions (constraints and objectives) are dicts ``{index: coefficient}``.
+    After :meth:`maximize`, ``x`` holds the solution (``None`` when the model is infeasible).
+    """
+
+    def __init__(self, options: dict = None):
+        self.lb = []
+        self.ub = []
+        self.integrality = []
+        self.options = options or {}
+        self.rows = {}  # handle -> (coefficients, lb, ub)
+        self.result = None
+        self.x = None
+        self._next_row = 0
+        self._matrix = None
+
+    @property
+    def num_vars(self) -> int:
+        return len(self.lb)
+
+    def add_vars(self, n: int, lb: float = 0.0, ub: float = np.inf, integer: bool = False) -> np.ndarray:
+        first = self.num_vars
+        self.lb.extend([lb] * n)
+        self.ub.extend([ub] * n)
+        self.integrality.extend([int(integer)] * n)
+        self._matrix = None
+        return np.arange(first, first + n)
+
+    def add_var(self, lb: float = 0.0, ub: float = np.inf, integer: bool = False) -> int:
+        return int(self.add_vars(1, lb, ub, integer)[0])
+
+    def add_constr(self, coefficients: Dict[int, float], lb: float = -np.inf, ub: float = np.inf) -> int:
+        """Add ``lb <= sum(coefficients[j] * x[j]) <= ub`` and return its handle."""
+        handle = self._next_row
+        self._next_row += 1
+        self.rows[handle] = [dict(coefficients), lb, ub]
+        self._matrix = None
+        return handle
+
+    def set_bounds(self, handle: int, lb: float, ub: float):
+        self.rows[handle][1:] = [lb, ub]
+
+    def remove(self, handles):
+        for handle in handles:
+            del self.rows[handle]
+        self._matrix = None
+
+    def _constraints(self):
+        # the sparse matrix is only rebuilt when rows are added or removed, not when their bounds change
+        if self._matrix is None:
+            data, indices, indptr = [], [], [0]
+            for coefficients, _, _ in self.rows.values():
+                indices.extend(coefficients.keys())
+                data.extend(coefficients.values())
+                indptr.append(len(indices))
+            self._matrix = csr_matrix((data, indices, indptr), shape=(len(self.rows), self.num_vars))
+        lb = [row[1] for row in self.rows.values()]
+        ub = [row[2] for row in self.rows.values()]
+        return LinearConstraint(self._matrix, lb, ub)
+
+    def maximize(self, coefficients: Dict[int, float]):
+        c = np.zeros(self.num_vars)
+        for j, coefficient in coefficients.items():
+            c[j] -= coefficient
+        constraints = self._constraints() if self.rows else None
+        self.result = milp(c, integrality=self.integrality, bounds=Bounds(self.lb, self.ub),
+                           constraints=constraints, options=self.options)
+        self.x = self.result.x
+        return self.x
+
+    def value(self, coefficients: Dict[int, float]) -> float:
+        return sum(coefficient * self.x[j] for j, coefficient in coefficients.items())
+
+
+class ScipyBackend(Backend):
+
+    def __init__(self, model: ScipyModel, objectives):
+        super().__init__(model, objectives)
+        self.objective = None
+        self.equalities = set()
+
+    def maximize(self, k: int, slack_weights: Dict[int, float] = None):
+        self.objective = dict(self.objectives[k])
+        for h, w in (slack_weights or {}).items():
+            self.objective[self.slacks[h]] = self.objective.get(self.slacks[h], 0.0) + w
+
+    def add_bound(self, k: int, rhs: float):
+        return self.model.add_constr(self.objectives[k], lb=rhs)
+
+    def add_epsilon_constraint(self, k: int, rhs: float):
+        self.slacks[k] = self.model.add_var()
+        coefficients = dict(self.objectives[k])
+        coefficients[self.slacks[k]] = -1.0
+        constraint = self.model.add_constr(coefficients, lb=rhs, ub=rhs)
+        self.equalities.add(constraint)
+        return constraint
+
+    def set_rhs(self, constraint, rhs: float):
+        self.model.set_bounds(constraint, rhs, rhs if constraint in self.equalities else np.inf)
+
+    def remove(self, constraints):
+        self.model.remove(constraints)
+
+    def solve(self) -> bool:
+        return self.model.maximize(self.objective) is not None
+
+    @property
+    def status(self) -> str:
+        # milp reports a time or node limit as 1, whether or not it found a solution
+        if self.model.result.status == 1:
+            return 'other' if self.model.x is None else 'feasible'
+        return _SCIPY_STATUS.get(self.model.result.status, 'other')
+
+    @property
+    def objective_value(self) -> float:
+        return self.model.value(self.objective)
+
+    def slack_values(self) -> Dict[int, float]:
+        return {k: self.model.x[s] for k, s in self.slacks.items()}
+
+    def objective_values(self) -> List[float]:
+        return [self.model.value(objective) for objective in self.objectives]
+
+    def values(self) -> np.ndarray:
+        return np.array(self.model.x)
@@ -1,178 +1,506 @@
+import inspect
+import itertools
+import json
 import logging
-from typing import Union, List, Dict, Callable, NoReturn
+import multiprocessing
+import os
+import tempfile
+import time
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Callable, Iterator, NoReturn
 
 import numpy as np
-from docplex.mp.linear import LinearExpr
-from docplex.mp.model import Model as CplexModel
-from gurobipy import GRB, quicksum, LinExpr
-from gurobipy import Model as GurobiModel
+
+from industrialucn.backends import Backend, CplexBackend, GurobiBackend, ScipyBackend
+from industrialucn.pareto import ParetoArchive, pareto_filter
 
 logger = logging.getLogger('econstraint')
 
+optimizers = {'cplex': CplexBackend, 'gurobi': GurobiBackend, 'scipy': ScipyBackend}
+
+GridPoint = namedtuple('GridPoint', 'index epsilon feasible objectives status time values')
+GridPoint.__doc__ = """Result of one grid solve: the grid index ``(i[1], ..., i[p - 1])``, the epsilon vector
+``{k: e[k]}``, feasibility, the objective vector, solver status (see :attr:`Backend.status`), solve time in seconds
+and variable values."""
+
+_grid_worker = None  # (backend, epsilon constraints) of a grid worker process
+
+
+def _get_backend(model, objectives, optimizer: str) -> Backend:
+    if optimizer not in optimizers:
+        raise NotImplementedError(f'{optimizer} is not a valid optimizer; must be one of {", ".join(optimizers)}')
+    return optimizers[optimizer](model, objectives)
+
 
-def _get_payoff_table_gurobi(mdl: GurobiModel, objectives: List[LinExpr]):
+def _payoff_row(backend: Backend, k: int, bounds):
+    # bounds[h] is the constraint objectives[h] >= -inf; its right-hand side is set in place to fix objective h along
+    # the lexicographic chain of objective k, and relaxed again at the end of the chain
+    payoff_row = {}
+    p = len(backend.objectives)
+    logger.info(f'Entering loop, k={k}')
+    backend.maximize(k)
+    backend.solve()
+    payoff_row[k, k] = backend.objective_value
+    backend.set_rhs(bounds[k], payoff_row[k, k])
+    for h in range(p):
+        logger.info(f'Entering loop, h={h}')
+        if h != k:
+            backend.maximize(h)
+            backend.solve()
+            payoff_row[k, h] = backend.objective_value
+            backend.set_rhs(bounds[h], payoff_row[k, h])
+    logger.info(f'About to relax constraints, k={k}')
+    for bound in bounds:
+        backend.set_rhs(bound, -backend.infinity)
+    return payoff_row
+
+
+def _add_bounds(backend: Backend):
+    return [backend.add_bound(k, -backend.infinity) for k in range(len(backend.objectives))]
+
+
+def _get_payoff_table(backend: Backend):
     payoff_table = {}
-    p = len(objectives)
-    for k in range(p):
-        logger.info(f'Entering loop, k={k}')
-        mdl.setObjective(objectives[k], sense=GRB.MAXIMIZE)
-        mdl.optimize()
-        payoff_table[k, k] = mdl.ObjVal
-        # noinspection PyArgumentList
-        constraints = [mdl.addConstr(objectives[k] >= payoff_table[k, k])]
-        for h in range(p):
-            logger.info(f'Entering loop, h={h}')
-            if h != k:
-                mdl.setObjective(objectives[h], sense=GRB.MAXIMIZE)
-                mdl.optimize()
-                payoff_table[k, h] = mdl.ObjVal
-                # noinspection PyArgumentList
-                constraints.append(
-                    mdl.addConstr(objectives[h] >= payoff_table[k, h])
-                )
-        logger.info(f'About to remove constraints, k={k}')
-        mdl.remove(constraints)
+    bounds = _add_bounds(backend)
+    for k in range(len(backend.objectives)):
+        payoff_table.update(_payoff_row(backend, k, bounds))
+    backend.remove(bounds)
     return payoff_table
 
 
-def _get_payoff_table_cplex(mdl: CplexModel, objectives: List[LinearExpr]):
+def _payoff_row_worker(backend_class, spec, k: int):
+    backend = backend_class.load(spec)
+    return _payoff_row(backend, k, _add_bounds(backend))
+
+
+def _get_payoff_table_parallel(backend: Backend, workers: int):
     payoff_table = {}
-    p = len(objectives)
-    for k in range(p):
-        logger.info(f'Entering loop, k={k}')
-        mdl.maximize(objectives[k])
-        solution = mdl.solve()
-        payoff_table[k, k] = solution.get_objective_value()
-        constraints = [mdl.add_constraint(objectives[k] >= payoff_table[k, k])]
-        for h in range(p):
-            logger.info(f'Entering loop, h={h}')
-            if h != k:
-                mdl.maximize(objectives[h])
-                solution = mdl.solve()
-                payoff_table[k, h] = solution.get_objective_value()
-                constraints.append(
-                    mdl.add_constraint(objectives[h] >= payoff_table[k, h])
-                )
-        logger.info(f'About to remove constraints, k={k}')
-        mdl.remove(constraints)
+    p = len(backend.objectives)
+    with tempfile.TemporaryDirectory() as directory:
+        spec = backend.export(directory)
+        with ProcessPoolExecutor(max_workers=min(workers, p),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            for payoff_row in pool.map(_payoff_row_worker, [type(backend)] * p, [spec] * p, range(p)):
+                payoff_table.update(payoff_row)
     return payoff_table
 
 
-def _run_econstraint_gurobi(mdl: GurobiModel, objectives: List[LinExpr], payoff_table, g: Dict[int, int] = None,
-                            solution_extractor: Callable = None) -> NoReturn:
-    p = len(objectives)
-    s = mdl.addVars([k for k in range(1, p)], name='s')
+def _grid_parameters(payoff_table, p: int):
     lb = {k: min(payoff_table[h, k] for h in range(p))
           for k in range(1, p)}
     r = {k: max(payoff_table[h, k] for h in range(p)) - min(payoff_table[h, k] for h in range(p))
          for k in range(1, p)}
     logger.debug('r: %s', r)
-    epsilon = 1e-3
-    mdl.setObjective(objectives[0] + epsilon * quicksum(s[k] / r[k] for k in range(1, p)), sense=GRB.MAXIMIZE)
+    return lb, r
+
+
+def _grid(g: Dict[int, int], p: int, order: str = 'lexicographic'):
+    """Grid indices ``(i[1], ..., i[p - 1])`` in sweep order; the first dimension changes fastest.
+
+    With ``order='snake'`` every other pass over a dimension is walked backwards (boustrophedon), so consecutive grid
+    points are always neighbours.
+    """
+    if order not in ('lexicographic', 'snake'):
+        raise NotImplementedError(f'{order} is not a valid order; must be "lexicographic" or "snake"')
+    indices = [()]
+    for k in range(1, p):
+        indices = [index + (v,)
+                   for v in range(g[k] + 1)
+                   for index in (indices[::-1] if order == 'snake' and v % 2 == 1 else indices)]
+    return indices
+
+
+def _epsilon(index, lb, r, g):
+    return {k: lb[k] + (index[k - 1] * r[k]) / g[k] for k in lb}
+
+
+def _bypassed(index, g: Dict[int, int], r, slacks=None):
+    """Grid points made redundant by the solve at ``index`` (AUGMECON2 bypass).
+
+    A solution with slack ``s[k]`` also satisfies the next ``floor(s[k] / step[k])`` epsilon values of objective k,
+    and it stays optimal there because those grid points only tighten the feasible set, so they would return the same
+    solution. Without ``slacks`` (an infeasible solve) every tighter grid point is infeasible too.
+    """
+    if slacks is None:
+        b = g
+    else:
+        b = {k: int(np.floor(slacks[k] * g[k] / r[k] + 1e-6)) if r[k] > 0 else g[k] for k in g}
+    return itertools.product(*(range(index[k - 1], min(g[k], index[k - 1] + b[k]) + 1) for k in g))
+
+
+class _Incumbents:
+    """Solutions found so far, kept to warm start the solve of the nearest grid point."""
+
+    def __init__(self):
+        self.indices = []
+        self.values = []
+
+    def add(self, index, values):
+        self.indices.append(index)
+        self.values.append(values)
+
+    def nearest(self, index):
+        if not self.indices:
+            return None
+        distance = np.abs(np.array(self.indices) - index).sum(axis=1)
+        # on ties, prefer the most recent solution
+        return self.values[len(distance) - 1 - int(np.argmin(distance[::-1]))]
+
+
+def _default_grid(g: Dict[int, int], p: int):
     if g is None:
         g = {k: 3 for k in range(1, p)}  # default number of grid
         logger.warning('Using default grid g=3')
-    i = {k: 0 for k in range(1, p)}
-    while True:
-        e = {k: lb[k] + (i[k] * r[k]) / g[k] for k in range(1, p)}
-        logger.info(f'i: {i}, e: {e}')
-        constraints = mdl.addConstrs(objectives[k] - s[k] == e[k] for k in range(1, p))
-        mdl.optimize()
-        if mdl.SolCount > 0:
-            solution_extractor()
-            logger.info('feasible')
-        else:
-            logger.info('not feasible')
-        mdl.remove(constraints)
-        if all(i[k] == g[k] for k in range(1, p)):
-            break
-        else:
-            for k in range(1, p):
-                if i[k] == g[k]:
-                    i[k] = 0
-                else:
-                    i[k] += 1
+    return g
+
+
+class _Checkpoint:
+    """Append-only JSON-lines log of a run, used to resume it after a crash.
+
+    The first line holds the grid and the payoff table; every other line records one solved grid point: its index,
+    epsilon vector, feasibility, objective vector, slacks and solve time. Without ``path`` nothing is written.
+
+    Every line is flushed as it is written, and the file is synced to disk at most every ``sync_interval`` seconds
+    and when the run ends. The variable values are not recorded, so the warm starts of a resumed run only use the
+    grid points solved after resuming.
+    """
+
+    sync_interval = 10
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.g = None
+        self.payoff_table = None
+        self.records = {}
+        self.file = None
+        self.synced = time.monotonic()
+        if path is None:
+            return
+        if os.path.isfile(path):
+            self._load()
+        self.file = open(path, 'a')
+
+    def _load(self):
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
                     break
+                if not line.endswith(b'\n'):
+                    break
+                end += len(line)
+                if 'payoff_table' in record:
+                    self.g = {int(k): v for k, v in record['g'].items()}
+                    self.payoff_table = {(k, h): v for k, h, v in record['payoff_table']}
+                else:
+                    self.records[tuple(record['index'])] = record
+        # drop the line that was being written when the run was interrupted
+        os.truncate(self.path, end)
+        logger.info(f'Loaded {len(self.records)} grid points from {self.path}')
 
+    def start(self, g: Dict[int, int], payoff_table):
+        if self.file is None:
+            return
+        if self.g is not None:
+            if self.g != g:
+                raise ValueError(f'{self.path} was written with grid {self.g}, not {g}')
+            return
+        self.g, self.payoff_table = g, payoff_table
+        self._write({'g': g, 'payoff_table': [[k, h, v] for (k, h), v in payoff_table.items()]})
 
-def _run_econstraint_cplex(mdl: CplexModel, objectives: List[LinearExpr], payoff_table, g: Dict[int, int] = None,
-                           solution_extractor: Callable = None) -> NoReturn:
-    p = len(objectives)
-    s = mdl.continuous_var_dict([k for k in range(1, p)], name='s')
-    lb = {k: min(payoff_table[h, k] for h in range(p))
-          for k in range(1, p)}
-    r = {k: max(payoff_table[h, k] for h in range(p)) - min(payoff_table[h, k] for h in range(p))
-         for k in range(1, p)}
-    logger.debug('r: %s', r)
+    def write(self, point, slacks):
+        if self.file is None:
+            return
+        self._write({'index': point.index,
+                     'e': [float(v) for v in point.epsilon.values()],
+                     'feasible': point.feasible,
+                     'objectives': None if point.objectives is None else [float(v) for v in point.objectives],
+                     'slacks': None if slacks is None else [float(v) for v in slacks.values()],
+                     'time': point.time})
+
+    def slacks(self, index):
+        slacks = self.records[index]['slacks']
+        return None if slacks is None else dict(zip(self.g, slacks))
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        if time.monotonic() - self.synced >= self.sync_interval:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.synced = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.file is not None:
+            self._sync()
+            self.file.close()
+
+
+def _add_epsilon_constraints(backend: Backend, lb, r):
+    """Add the slacks, the augmented objective and the constraints ``objectives[k] - s[k] == e[k]``.
+
+    The constraints are created once at ``e = lb`` and moved to each grid point by changing their right-hand side, so
+    the model is never rebuilt and the solver keeps its basis between grid points.
+    """
+    constraints = {k: backend.add_epsilon_constraint(k, lb[k]) for k in lb}
     epsilon = 1e-3
-    mdl.maximize(objectives[0] + epsilon * mdl.sum(s[k] / r[k] for k in range(1, p)))
-    if g is None:
-        g = {k: 3 for k in range(1, p)}  # default number of grid
-        logger.warning('Using default grid g=3')
-    i = {k: 0 for k in range(1, p)}
-    while True:
-        e = {k: lb[k] + (i[k] * r[k]) / g[k] for k in range(1, p)}
-        logger.info(f'i: {i}, e: {e}')
-        constraints = mdl.add_constraints(objectives[k] - s[k] == e[k] for k in range(1, p))
-        solution = mdl.solve()
-        if solution is not None:
-            solution_extractor()
-            logger.info('feasible')
-        else:
-            logger.info('not feasible')
-        mdl.remove(constraints)
-        if all(i[k] == g[k] for k in range(1, p)):
-            break
-        else:
-            for k in range(1, p):
-                if i[k] == g[k]:
-                    i[k] = 0
-                else:
-                    i[k] += 1
-                    break
+    backend.maximize(0, slack_weights={k: epsilon / r[k] for k in r})
+    return constraints
 
 
-def get_payoff_table(model: Union[CplexModel, GurobiModel],
-                     objectives: Union[List[LinearExpr], List[LinExpr]],
-                     optimizer: str):
-    if optimizer == 'cplex':
-        return _get_payoff_table_cplex(model, objectives)
-    elif optimizer == 'gurobi':
-        return _get_payoff_table_gurobi(model, objectives)
-    else:
-        raise NotImplementedError(f'{optimizer} is not a valid optimizer; must be "cplex" or "gurobi"')
+def _solve_grid_point(backend: Backend, constraints, index, e, start=None):
+    """Solve one grid point and return its :class:`GridPoint` and its slacks (None if infeasible)."""
+    for k in e:
+        backend.set_rhs(constraints[k], e[k])
+    if start is not None:
+        backend.set_start(start)
+    started = time.perf_counter()
+    feasible = backend.solve()
+    elapsed = time.perf_counter() - started
+    if feasible:
+        point = GridPoint(index, e, True, backend.objective_values(), backend.status, elapsed, backend.values())
+        return point, backend.slack_values()
+    return GridPoint(index, e, False, None, backend.status, elapsed, None), None
+
+
+def _resume(checkpoint: _Checkpoint, g: Dict[int, int], r, bypass: bool):
+    # grid points already in the checkpoint are not solved again, and still bypass the points they made redundant
+    skipped = set()
+    for index in checkpoint.records:
+        if bypass:
+            skipped.update(_bypassed(index, g, r, checkpoint.slacks(index)))
+    return skipped
+
+
+def _iter_econstraint(backend: Backend, payoff_table, g: Dict[int, int], bypass: bool = False,
+                      warm_start: bool = False, order: str = 'lexicographic', checkpoint: _Checkpoint = None):
+    p = len(backend.objectives)
+    lb, r = _grid_parameters(payoff_table, p)
+    constraints = _add_epsilon_constraints(backend, lb, r)
+    checkpoint = checkpoint or _Checkpoint()
+    skipped = _resume(checkpoint, g, r, bypass)
+    incumbents = _Incumbents()
+    try:
+        for index in _grid(g, p, order):
+            i = dict(zip(range(1, p), index))
+            if index in checkpoint.records:
+                logger.info(f'i: {i} restored from checkpoint')
+                continue
+            if index in skipped:
+                logger.info(f'i: {i} bypassed')
+                continue
+            e = _epsilon(index, lb, r, g)
+            logger.info(f'i: {i}, e: {e}')
+            point, slacks = _solve_grid_point(backend, constraints, index, e, incumbents.nearest(index))
+            if point.feasible:
+                if bypass:
+                    skipped.update(_bypassed(index, g, r, slacks))
+                if warm_start:
+                    incumbents.add(index, point.values)
+                logger.info('feasible')
+            else:
+                if bypass:
+                    skipped.update(_bypassed(index, g, r))
+                logger.info('not feasible')
+            checkpoint.write(point, slacks)
+            yield point
+    finally:
+        backend.remove(constraints.values())
+
+
+def _init_grid_worker(backend_class, spec, lb, r):
+    global _grid_worker
+    backend = backend_class.load(spec)
+    _grid_worker = backend, _add_epsilon_constraints(backend, lb, r)
+
+
+def _solve_grid_point_worker(index, e, start=None):
+    backend, constraints = _grid_worker
+    return _solve_grid_point(backend, constraints, index, e, start)
+
+
+def _iter_econstraint_parallel(backend: Backend, payoff_table, g: Dict[int, int], workers: int,
+                               bypass: bool = False, warm_start: bool = False, order: str = 'lexicographic',
+                               checkpoint: _Checkpoint = None):
+    p = len(backend.objectives)
+    lb, r = _grid_parameters(payoff_table, p)
+    checkpoint = checkpoint or _Checkpoint()
+    grid = iter(index for index in _grid(g, p, order) if index not in checkpoint.records)
+    skipped = _resume(checkpoint, g, r, bypass)
+    incumbents = _Incumbents()
+    with tempfile.TemporaryDirectory() as directory:
+        spec = backend.export(directory)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_grid_worker, initargs=(type(backend), spec, lb, r)) as pool:
+            pending = set()
+            try:
+                while True:
+                    # submit lazily, so that grid points bypassed by finished solves are never sent to a worker
+                    while len(pending) < 2 * workers:
+                        index = next((index for index in grid if index not in skipped), None)
+                        if index is None:
+                            break
+                        e = _epsilon(index, lb, r, g)
+                        logger.info(f'i: {dict(zip(range(1, p), index))}, e: {e}')
+                        pending.add(pool.submit(_solve_grid_point_worker, index, e, incumbents.nearest(index)))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        point, slacks = future.result()
+                        if bypass:
+                            skipped.update(_bypassed(point.index, g, r, slacks))
+                        if point.feasible:
+                            if warm_start:
+                                incumbents.add(point.index, point.values)
+                            logger.info(f'i: {dict(zip(range(1, p), point.index))} feasible')
+                        else:
+                            logger.info(f'i: {dict(zip(range(1, p), point.index))} not feasible')
+                        checkpoint.write(point, slacks)
+                        yield point
+            finally:
+                # the consumer may stop early; do not start the grid points still waiting in the pool
+                for future in pending:
+                    future.cancel()
 
 
-def run_econstraint(model: Union[CplexModel, GurobiModel],
-                    objectives: Union[List[LinearExpr], List[LinExpr]],
+def get_payoff_table(model, objectives, optimizer: str, workers: int = None):
+    """Compute the lexicographic payoff table ``{(k, h): value}`` of ``objectives``.
+
+    With ``workers`` > 1 the p lexicographic chains run in separate processes, each on its own copy of ``model``;
+    ``model`` itself is left untouched.
+    """
+    backend = _get_backend(model, objectives, optimizer)
+    if workers is None or workers <= 1:
+        return _get_payoff_table(backend)
+    return _get_payoff_table_parallel(backend, workers)
+
+
+def iter_econstraint(model,
+                     objectives,
+                     optimizer: str,
+                     g: Dict[int, int] = None,
+                     payoff_table=None,
+                     workers: int = None,
+                     bypass: bool = False,
+                     warm_start: bool = False,
+                     order: str = 'lexicographic',
+                     checkpoint_path: str = None,
+                     nondominated: bool = False,
+                     archive: ParetoArchive = None) -> Iterator[GridPoint]:
+    """Run the augmented epsilon-constraint method over the grid ``g``, yielding a :class:`GridPoint` per solve.
+
+    ``optimizer`` selects the backend: "cplex" (docplex model), "gurobi" (gurobipy model) or "scipy"
+    (:class:`industrialucn.backends.ScipyModel`, with objectives given as ``{variable: coefficient}`` dicts).
+
+    Grid points are yielded as soon as they are solved; in serial runs ``model`` still holds the solution while the
+    generator is suspended. The consumer can stop iterating at any time.
+
+    The objective vector of every feasible solve is inserted into ``archive``, a :class:`ParetoArchive` with
+    ``maximize=True``, when one is given. With ``nondominated`` only the grid points accepted by the archive are
+    yielded, that is, those whose objective vector is neither dominated by nor equal to one found before (a later
+    solution may still dominate an earlier one).
+
+    With ``workers`` > 1 the payoff table and the grid points are solved in separate processes, each holding its own
+    copy of ``model``, and grid points are yielded in completion order.
+
+    With ``bypass`` the slack of each solve is used to skip the grid points that would return the same solution, and
+    the grid points tighter than an infeasible one are skipped as well (AUGMECON2).
+
+    With ``warm_start`` the solution of the nearest grid point solved so far is passed to the solver as a MIP start.
+    ``order='snake'`` walks the grid as a boustrophedon, so that the previous grid point is always a neighbour.
+
+    With ``checkpoint_path`` the payoff table and a record of every solved grid point are appended to a JSON-lines
+    file. Rerunning with the same file reuses the payoff table and skips the grid points already solved, so an
+    interrupted run only repeats the grid point that was in progress. The objective vectors of the checkpointed grid
+    points are inserted into ``archive`` before the sweep, so ``nondominated`` does not yield them again. Warm-start
+    solutions are not part of the checkpoint: after resuming, ``warm_start`` only draws on the grid points solved in
+    the new run.
+    """
+    backend = _get_backend(model, objectives, optimizer)
+    g = _default_grid(g, len(objectives))
+    with _Checkpoint(checkpoint_path) as checkpoint:
+        if payoff_table is None:
+            payoff_table = checkpoint.payoff_table
+        pot = get_payoff_table(model, objectives, optimizer, workers) if payoff_table is None else payoff_table
+        logger.debug(pot)
+        checkpoint.start(g, pot)
+        if workers is not None and workers > 1:
+            points = _iter_econstraint_parallel(backend, pot, g, workers, bypass, warm_start, order, checkpoint)
+        else:
+            points = _iter_econstraint(backend, pot, g, bypass, warm_start, order, checkpoint)
+        if archive is None and nondominated:
+            archive = ParetoArchive(len(objectives), maximize=True)
+        if archive is not None:
+            # the grid points of an interrupted run were yielded then, and still count towards the frontier
+            for index, record in checkpoint.records.items():
+                if record['feasible']:
+                    archive.add(record['objectives'], index)
+        for point in points:
+            inserted = point.feasible and archive is not None and archive.add(point.objectives, point.index)
+            if nondominated and not inserted:
+                continue
+            yield point
+
+
+def run_econstraint(model,
+                    objectives,
                     solution_extractor: Callable,
                     optimizer: str,
                     g: Dict[int, int] = None,
-                    payoff_table=None) -> NoReturn:
-    if optimizer == 'cplex':
-        pot = _get_payoff_table_cplex(model, objectives) if payoff_table is None else payoff_table
-        logger.debug(pot)
-        return _run_econstraint_cplex(model, objectives, pot, g, solution_extractor=solution_extractor)
-    elif optimizer == 'gurobi':
-        pot = _get_payoff_table_gurobi(model, objectives) if payoff_table is None else payoff_table
-        logger.debug(pot)
-        return _run_econstraint_gurobi(model, objectives, pot, g, solution_extractor=solution_extractor)
-    else:
-        raise NotImplementedError(f'{optimizer} is not a valid optimizer; must be "cplex" or "gurobi"')
+                    payoff_table=None,
+                    workers: int = None,
+                    bypass: bool = False,
+                    warm_start: bool = False,
+                    order: str = 'lexicographic',
+                    checkpoint_path: str = None,
+                    archive: ParetoArchive = None) -> NoReturn:
+    """Run the augmented epsilon-constraint method over the grid ``g``; see :func:`iter_econstraint`.
 
+    ``solution_extractor(index, values)`` is called after each feasible solve, serial or parallel, with the grid index
+    ``(i[1], ..., i[p - 1])`` and the values of the variables of the model (the worker's copy with ``workers`` > 1)
+    ordered by variable index. In serial runs ``model`` also holds the solution during the call. With
+    ``checkpoint_path`` it is only called for the grid points solved in the current run.
 
-def all_non_dominated(solution_list):
-    for i, fi in enumerate(solution_list):
-        if any(all(fjk < fik or np.isclose(fjk, fik) for fik, fjk in zip(fi, fj)) and
-               any(fjk < fik and not np.isclose(fjk, fik) for fik, fjk in zip(fi, fj))
-               for j, fj in enumerate(solution_list) if j != i):
-            return False
+    A ``solution_extractor()`` without arguments is still accepted in serial runs, but deprecated.
+    """
+    legacy = not _accepts_grid_point(solution_extractor)
+    if legacy:
+        if workers is not None and workers > 1:
+            raise TypeError('solution_extractor must accept (index, values)')
+        warnings.warn('solution_extractor() without arguments is deprecated; accept (index, values) instead',
+                      DeprecationWarning, stacklevel=2)
+    for point in iter_econstraint(model, objectives, optimizer, g, payoff_table, workers, bypass, warm_start, order,
+                                  checkpoint_path, archive=archive):
+        if point.feasible:
+            if legacy:
+                solution_extractor()
+            else:
+                solution_extractor(point.index, point.values)
+
+
+def _accepts_grid_point(function) -> bool:
+    try:
+        inspect.signature(function).bind(None, None)
+    except TypeError:
+        return False
+    except ValueError:  # no signature available, assume the current one
+        pass
     return True
 
 
+def all_non_dominated(solution_list):
+    return len(pareto_filter(solution_list)) == len(solution_list)
+
+
 def all_weakly_non_dominated(solution_list):
-    for i, fi in enumerate(solution_list):
-        if any(all(fjk < fik and not np.isclose(fjk, fik) for fik, fjk in zip(fi, fj))
-               for j, fj in enumerate(solution_list) if j != i):
-            return False
-    return True
+    return len(pareto_filter(solution_list, weak=True)) == len(solution_list)
@@ -5,6 +5,7 @@ import unittest
 import numpy as np
 
 from industrialucn import econstraint as ec
+from industrialucn.pareto import ParetoArchive
 
 
 def config_logger(logger, level):
@@ -33,6 +34,42 @@ distance = {(i, j): np.hypot(cbx[i] - cpx[j], cby[i] - cpy[j])
             for i in buildings for j in parks}
 
 
+def gurobi_facility_location(vtype):
+    from gurobipy import Model as GurobiModel
+    from gurobipy import quicksum
+
+    mdl = GurobiModel()
+    x = mdl.addVars(parks, vtype=vtype, name='x')
+    y = mdl.addVars([(i, j) for i in buildings for j in parks], vtype=vtype, name='y')
+    z = mdl.addVars([0])[0]
+    objectives = [quicksum(-1 * x[i] for i in parks),
+                  quicksum(-1 * distance[i, j] * y[i, j] for i in buildings for j in parks),
+                  0 - z]
+    mdl.addConstrs(y[i, j] <= x[j] for i in buildings for j in parks)
+    mdl.addConstrs(quicksum(y[i, j] for j in parks) >= 1 for i in buildings)
+    mdl.addConstrs(distance[i, j] * y[i, j] <= z for i in buildings for j in parks)
+    return mdl, x, y, z, objectives
+
+
+def scipy_facility_location(integer):
+    from industrialucn.backends import ScipyModel
+
+    mdl = ScipyModel()
+    ub = 1 if integer else np.inf
+    x = dict(zip(parks, mdl.add_vars(n, ub=ub, integer=integer)))
+    y = dict(zip([(i, j) for i in buildings for j in parks], mdl.add_vars(m * n, ub=ub, integer=integer)))
+    z = mdl.add_var()
+    objectives = [{x[i]: -1.0 for i in parks},
+                  {y[i, j]: -distance[i, j] for i in buildings for j in parks},
+                  {z: -1.0}]
+    for i in buildings:
+        for j in parks:
+            mdl.add_constr({y[i, j]: 1.0, x[j]: -1.0}, ub=0.0)
+            mdl.add_constr({y[i, j]: distance[i, j], z: -1.0}, ub=0.0)
+        mdl.add_constr({y[i, j]: 1.0 for j in parks}, lb=1.0)
+    return mdl, x, y, z, objectives
+
+
 class EConstraint(unittest.TestCase):
 
     def test_dominance(self):
@@ -74,6 +111,25 @@ class EConstraint(unittest.TestCase):
         self.assertTrue(ec.all_weakly_non_dominated(v2))
         self.assertFalse(ec.all_weakly_non_dominated(v3))
 
+        self.assertListEqual(list(ec.pareto_filter(v3)), [0, 3, 7, 9])
+        self.assertListEqual(list(ec.pareto_filter(v3, weak=True)), [0, 1, 2, 3, 4, 5, 6, 7, 9])
+
+    def test_pareto_filter(self):
+        def dominated(fi, fj, weak):
+            if weak:
+                return all(fjk < fik and not np.isclose(fjk, fik) for fik, fjk in zip(fi, fj))
+            return (all(fjk < fik or np.isclose(fjk, fik) for fik, fjk in zip(fi, fj)) and
+                    any(fjk < fik and not np.isclose(fjk, fik) for fik, fjk in zip(fi, fj)))
+
+        rnd_state = np.random.RandomState(1)
+        for p in (2, 3, 4):
+            points = np.round(rnd_state.rand(300, p) * 10, 1)
+            for weak in (False, True):
+                expected = [i for i, fi in enumerate(points)
+                            if not any(dominated(fi, fj, weak) for j, fj in enumerate(points) if j != i)]
+                self.assertListEqual(list(ec.pareto_filter(points, weak=weak)), expected)
+                self.assertListEqual(list(ec.pareto_filter(points, weak=weak, block_size=64)), expected)
+
     def test_run_econstraint_cplex_mip(self):
         from docplex.mp.model import Model as CplexModel
 
@@ -285,6 +341,271 @@ class EConstraint(unittest.TestCase):
 
         self.assertTrue(ec.all_non_dominated(fvs))
 
+    def test_payoff_table_gurobi_workers(self):
+        from gurobipy import GRB
+
+        mdl, _, _, _, objectives = gurobi_facility_location(GRB.BINARY)
+        serial = ec.get_payoff_table(mdl, objectives, optimizer='gurobi')
+        parallel = ec.get_payoff_table(mdl, objectives, optimizer='gurobi', workers=3)
+        self.assertSetEqual(set(serial), set(parallel))
+        for key in serial:
+            self.assertAlmostEqual(serial[key], parallel[key], places=4)
+
+    def test_run_econstraint_gurobi_workers(self):
+        from gurobipy import GRB
+
+        fvs = {}
+        for workers in (None, 2):
+            mdl, x, y, z, objectives = gurobi_facility_location(GRB.BINARY)
+            # the augmentation term (1e-3) is below the default gap, which lets either run stop at a weakly
+            # dominated alternative; solve to optimality so that both runs find the same frontier
+            mdl.Params.MIPGap = 0
+            indices = []
+            fvs[workers] = []
+
+            def extract_solution(index, values):
+                indices.append(index)
+                fvs[workers].append([sum(values[x[i].index] for i in parks),
+                                     sum(distance[i, j] * values[y[i, j].index] for i in buildings for j in parks),
+                                     values[z.index]])
+
+            ec.run_econstraint(model=mdl,
+                               objectives=objectives,
+                               solution_extractor=extract_solution,
+                               optimizer='gurobi',
+                               workers=workers)
+            self.assertEqual(len(indices), len(set(indices)))
+
+        self.assertTrue(ec.all_weakly_non_dominated(fvs[2]))
+        np.testing.assert_allclose(sorted(np.round(fvs[None], 4).tolist()), sorted(np.round(fvs[2], 4).tolist()),
+                                   atol=1e-4)
+
+        with self.assertRaises(TypeError):
+            ec.run_econstraint(mdl, objectives, lambda: None, 'gurobi', workers=2)
+
+    def test_run_econstraint_gurobi_bypass(self):
+        from gurobipy import GRB
+
+        fvs = {}
+        for bypass in (False, True):
+            mdl, x, y, z, objectives = gurobi_facility_location(GRB.BINARY)
+            fvs[bypass] = []
+            ec.run_econstraint(model=mdl,
+                               objectives=objectives,
+                               solution_extractor=lambda index, values: fvs[bypass].append(
+                                   [round(-objective.getValue(), 4) for objective in objectives]),
+                               optimizer='gurobi',
+                               g={1: 5, 2: 5},
+                               bypass=bypass)
+
+        self.assertLess(len(fvs[True]), len(fvs[False]))
+        self.assertTrue(ec.all_weakly_non_dominated(fvs[True]))
+        self.assertTrue(ec.all_weakly_non_dominated(fvs[False] + fvs[True]))
+
+    def test_run_econstraint_gurobi_warm_start(self):
+        from gurobipy import GRB
+
+        indices = ec._grid({1: 3, 2: 2, 3: 2}, 4, order='snake')
+        self.assertEqual(len(set(indices)), 4 * 3 * 3)
+        self.assertTrue(all(np.abs(np.subtract(a, b)).sum() == 1 for a, b in zip(indices, indices[1:])))
+
+        mdl, x, y, z, objectives = gurobi_facility_location(GRB.BINARY)
+        fvs = []
+        ec.run_econstraint(model=mdl,
+                           objectives=objectives,
+                           solution_extractor=lambda index, values: fvs.append(
+                               [-objective.getValue() for objective in objectives]),
+                           optimizer='gurobi',
+                           warm_start=True,
+                           order='snake')
+
+        self.assertEqual(len(fvs), 16)
+        self.assertTrue(ec.all_weakly_non_dominated(fvs))
+
+    def test_run_econstraint_scipy_mip(self):
+        mdl, x, y, z, objectives = scipy_facility_location(integer=True)
+        payoff_table = ec.get_payoff_table(mdl, objectives, optimizer='scipy')
+        # the same table is obtained with gurobi on gurobi_facility_location
+        expected_payoff_table = {(0, 0): -1, (0, 1): -4324.756, (0, 2): -165.360,
+                                 (1, 0): -13, (1, 1): -1351.079, (1, 2): -56.902,
+                                 (2, 0): -6, (2, 1): -1497.219, (2, 2): -56.902}
+        self.assertEqual(payoff_table.keys(), expected_payoff_table.keys())
+        for key in payoff_table:
+            self.assertAlmostEqual(payoff_table[key], expected_payoff_table[key], places=3)
+
+        fvs = []
+
+        def extract_solution(index, values):
+            fvs.append([sum(mdl.x[x[i]] for i in parks),
+                        sum(distance[i, j] * mdl.x[y[i, j]] for i in buildings for j in parks),
+                        mdl.x[z]])
+
+        ec.run_econstraint(model=mdl,
+                           objectives=objectives,
+                           solution_extractor=extract_solution,
+                           optimizer='scipy',
+                           payoff_table=payoff_table)
+
+        self.assertEqual(len(fvs), 16)
+        self.assertTrue(ec.all_weakly_non_dominated(fvs))
+        np.testing.assert_allclose(sorted(set(map(tuple, np.round(fvs, 3).tolist()))),
+                                   [(1, 4324.756, 165.360), (2, 2937.781, 107.716), (3, 2106.863, 74.841),
+                                    (6, 1497.219, 56.902), (13, 1351.079, 56.902)], atol=1e-3)
+
+    def test_run_econstraint_scipy_lp(self):
+        mdl, x, y, z, objectives = scipy_facility_location(integer=False)
+        fvs = []
+
+        def extract_solution(index, values):
+            fvs.append([sum(mdl.x[x[i]] for i in parks),
+                        sum(distance[i, j] * mdl.x[y[i, j]] for i in buildings for j in parks),
+                        mdl.x[z]])
+
+        ec.run_econstraint(model=mdl,
+                           objectives=objectives,
+                           solution_extractor=extract_solution,
+                           optimizer='scipy')
+
+        self.assertTrue(ec.all_non_dominated(fvs))
+
+    def test_iter_econstraint(self):
+        mdl, x, y, z, objectives = scipy_facility_location(integer=True)
+        points = list(ec.iter_econstraint(mdl, objectives, 'scipy', g={1: 3, 2: 3}))
+        self.assertEqual([point.index for point in points], list(ec._grid({1: 3, 2: 3}, 3)))
+        for point in points:
+            self.assertEqual(sorted(point.epsilon), [1, 2])
+            self.assertGreaterEqual(point.time, 0)
+            if point.feasible:
+                self.assertEqual(len(point.objectives), 3)
+                self.assertEqual(point.status, 'optimal')
+        nondominated = list(ec.iter_econstraint(mdl, objectives, 'scipy', g={1: 3, 2: 3}, nondominated=True))
+        self.assertTrue(all(point.feasible for point in nondominated))
+        # each yielded vector is neither dominated by nor equal to an earlier one (objectives are maximized)
+        for t, point in enumerate(nondominated):
+            for earlier in nondominated[:t]:
+                self.assertFalse(all(a >= b - 1e-6 for a, b in zip(earlier.objectives, point.objectives)))
+        archive = ParetoArchive(3, maximize=True)
+        ec.run_econstraint(mdl, objectives, lambda index, values: None, 'scipy', g={1: 3, 2: 3}, archive=archive)
+        self.assertEqual(len(archive), len(ec.pareto_filter(-archive.points)))
+        self.assertTrue(set(archive.keys) <= {point.index for point in nondominated})
+        with self.assertWarns(DeprecationWarning):
+            ec.run_econstraint(mdl, objectives, lambda: None, 'scipy', g={1: 1, 2: 1})
+        # stopping early leaves the model without epsilon constraints
+        rows = len(mdl.rows)
+        generator = ec.iter_econstraint(mdl, objectives, 'scipy', g={1: 3, 2: 3})
+        next(generator)
+        generator.close()
+        self.assertEqual(len(mdl.rows), rows)
+        # statuses are mapped to the same small set for every backend
+        backend = ec._get_backend(mdl, objectives, 'scipy')
+        backend.maximize(0)
+        bound = backend.add_bound(0, 1)
+        self.assertFalse(backend.solve())
+        self.assertEqual(backend.status, 'infeasible')
+        backend.remove([bound])
+        self.assertTrue(backend.solve())
+        self.assertEqual(backend.status, 'optimal')
+        # gurobi reports the infeasible grid points of this model as INF_OR_UNBD
+        from gurobipy import Model as GurobiModel
+        from gurobipy import GRB, quicksum
+
+        mdl = GurobiModel()
+        mdl.Params.OutputFlag = 0
+        x = mdl.addVars(6, vtype=GRB.BINARY)
+        mdl.addConstr(x.sum() <= 2)
+        c = np.random.RandomState(1).randint(1, 10, (3, 6))
+        objectives = [quicksum(int(c[k, i]) * x[i] for i in range(6)) for k in range(3)]
+        points = list(ec.iter_econstraint(mdl, objectives, 'gurobi', g={1: 4, 2: 4}))
+        self.assertEqual(mdl.Status, GRB.INF_OR_UNBD)
+        self.assertTrue(any(not point.feasible for point in points))
+        for point in points:
+            self.assertEqual(point.status, 'optimal' if point.feasible else 'infeasible')
+
+    def test_run_econstraint_scipy_workers(self):
+        mdl, x, y, z, objectives = scipy_facility_location(integer=True)
+        fvs = {}
+
+        def extract_solution(index, values):
+            fvs[index] = [sum(values[x[i]] for i in parks),
+                          sum(distance[i, j] * values[y[i, j]] for i in buildings for j in parks),
+                          values[z]]
+
+        ec.run_econstraint(model=mdl,
+                           objectives=objectives,
+                           solution_extractor=extract_solution,
+                           optimizer='scipy',
+                           workers=2,
+                           bypass=True)
+
+        self.assertIn((0, 0), fvs)
+        self.assertTrue(ec.all_weakly_non_dominated(list(fvs.values())))
+
+    def test_run_econstraint_checkpoint(self):
+        import json
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, 'checkpoint.jsonl')
+            mdl, x, y, z, objectives = scipy_facility_location(integer=True)
+            calls = []
+            with mock.patch.object(ec.os, 'fsync', wraps=os.fsync) as fsync:
+                ec.run_econstraint(model=mdl,
+                                   objectives=objectives,
+                                   solution_extractor=lambda index, values: calls.append(index),
+                                   optimizer='scipy',
+                                   checkpoint_path=checkpoint_path)
+            # the file is synced when the run ends
+            self.assertGreaterEqual(fsync.call_count, 1)
+            with open(checkpoint_path) as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), 17)
+            self.assertEqual(len(calls), 16)
+            records = [json.loads(line) for line in lines[1:]]
+            self.assertTrue(all(record['feasible'] and len(record['objectives']) == 3 for record in records))
+
+            # simulate a crash in the middle of writing the seventh grid point
+            with open(checkpoint_path, 'w') as f:
+                f.writelines(lines[:7])
+                f.write(lines[7][:10])
+            mdl, x, y, z, objectives = scipy_facility_location(integer=True)
+            calls = []
+            ec.run_econstraint(model=mdl,
+                               objectives=objectives,
+                               solution_extractor=lambda index, values: calls.append(index),
+                               optimizer='scipy',
+                               checkpoint_path=checkpoint_path)
+            self.assertEqual(len(calls), 10)
+            with open(checkpoint_path) as f:
+                resumed = [json.loads(line) for line in f.readlines()[1:]]
+            self.assertSetEqual({tuple(record['index']) for record in resumed},
+                                {tuple(record['index']) for record in records})
+
+            with self.assertRaises(ValueError):
+                ec.run_econstraint(model=mdl,
+                                   objectives=objectives,
+                                   solution_extractor=lambda index, values: None,
+                                   optimizer='scipy',
+                                   g={1: 2, 2: 2},
+                                   checkpoint_path=checkpoint_path)
+
+            # a resumed run neither yields the vectors found before the interruption again nor loses them
+            checkpoint_path = os.path.join(directory, 'nondominated.jsonl')
+            mdl, x, y, z, objectives = scipy_facility_location(integer=True)
+            full = ParetoArchive(3, maximize=True)
+            ec.run_econstraint(mdl, objectives, lambda index, values: None, 'scipy', archive=full)
+            generator = ec.iter_econstraint(mdl, objectives, 'scipy', checkpoint_path=checkpoint_path,
+                                            nondominated=True)
+            yielded = [tuple(next(generator).objectives) for _ in range(2)]
+            generator.close()
+            archive = ParetoArchive(3, maximize=True)
+            yielded += [tuple(point.objectives) for point in
+                        ec.iter_econstraint(mdl, objectives, 'scipy', checkpoint_path=checkpoint_path,
+                                            nondominated=True, archive=archive)]
+            self.assertEqual(len(yielded), len(set(yielded)))
+            self.assertEqual(len(archive), len(full))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,83 +1,631 @@
+import logging
 import os.path
-from collections import namedtuple
+import sqlite3
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from scipy import sparse as sp
+except ImportError:
+    sp = None
 
 Location = namedtuple('Location', 'id lat lon x y')
+Block = namedtuple('Block', 'sources destinations pairs')
+TimeMatrix = namedtuple('TimeMatrix', 'locations durations')
+Progress = namedtuple('Progress', 'pairs total requests failed elapsed requests_per_second pairs_per_second '
+                                  'latency_p50 latency_p95 latency_p99 cache_hit_rate')
+
+logger = logging.getLogger('osrm')
+
+data_path = 'osrm.db'
+server = 'http://localhost:5000'
+EARTH_RADIUS = 6_371_009  # meters, the mean radius used by geopy's great_circle
+
+
+def project(lat, lon, ref_lat=None, ref_lon=None):
+    """Planar ``x``, ``y`` coordinates (meters) of the points, from the reference point (by default the minima).
+
+    ``x`` is the great circle distance from ``(ref_lat, ref_lon)`` to ``(ref_lat, lon)``, and ``y`` the one to
+    ``(lat, ref_lon)``, both signed.
+    """
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    ref_lat = lat.min() if ref_lat is None else np.radians(ref_lat)
+    ref_lon = lon.min() if ref_lon is None else np.radians(ref_lon)
+    x = 2 * EARTH_RADIUS * np.arcsin(np.cos(ref_lat) * np.sin((lon - ref_lon) / 2))
+    y = EARTH_RADIUS * (lat - ref_lat)
+    return x, y
+
+
+def neighbour_pairs(x, y, radius, ids=None, metric='chebyshev', chunksize=100_000):
+    """Ordered pairs of distinct points within ``radius`` of each other, as two ``np.int32`` arrays ``(i, j)``.
+
+    With the ``'chebyshev'`` metric both ``|x_i - x_j|`` and ``|y_i - y_j|`` are at most ``radius``; with
+    ``'euclidean'`` the distance is. The points are bucketed on a grid of ``radius`` cells, so only the 9 cells around
+    each point are searched, ``chunksize`` points at a time. Pairs hold ``ids[k]`` (row numbers by default) and are
+    sorted by ``i``, then ``j``.
+    """
+    if metric not in ('chebyshev', 'euclidean'):
+        raise NotImplementedError(f"Metric '{metric}' not supported.")
+    if ids is not None:
+        ids = _int32_ids(ids)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = len(x)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    cx = np.floor(x / radius).astype(np.int64)
+    cy = np.floor(y / radius).astype(np.int64)
+    cx -= cx.min() - 1  # an empty column and row of cells around the points, so neighbouring keys never wrap
+    cy -= cy.min() - 1
+    width = cx.max() + 2
+    key = cy * width + cx
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+    i_parts, j_parts = [], []
+    for start in range(0, n, chunksize):
+        a = np.arange(start, min(n, start + chunksize))
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                target = key[a] + dy * width + dx
+                lo = np.searchsorted(sorted_key, target, side='left')
+                counts = np.searchsorted(sorted_key, target, side='right') - lo
+                i = np.repeat(a, counts)
+                j = order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+                if metric == 'chebyshev':
+                    near = (np.abs(x[i] - x[j]) <= radius) & (np.abs(y[i] - y[j]) <= radius)
+                else:
+                    near = (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 <= radius ** 2
+                near &= i != j
+                i_parts.append(i[near])
+                j_parts.append(j[near])
+    i, j = np.concatenate(i_parts), np.concatenate(j_parts)
+    order = np.lexsort((j, i))
+    i, j = i[order], j[order]
+    if ids is not None:
+        i, j = ids[i], ids[j]
+    return i.astype(np.int32), j.astype(np.int32)
+
+
+def _int32_ids(ids):
+    # location ids as np.int32; ValueError rather than wrapping around when they do not fit
+    ids = np.asarray(ids)
+    if ids.size > 0 and (ids.min() < np.iinfo(np.int32).min or ids.max() > np.iinfo(np.int32).max):
+        raise ValueError("Location ids must be 32-bit integers.")
+    return ids.astype(np.int32)
+
+
+class LocationSet:
+    """Locations stored column-wise, as ``id`` (``np.int32``), ``lat``, ``lon``, ``x`` and ``y`` arrays.
+
+    ``x`` and ``y`` default to :func:`project` of ``lat`` and ``lon``. :meth:`rows` finds the rows of ids through a
+    sorted copy of the ids. Indexing with an integer gives a :class:`Location` and with an array or slice a new set;
+    iterating gives :class:`Location` s, so a set can stand in for a list of them.
+
+    Pairs of locations are two ``np.int32`` arrays ``(i, j)`` of ids, as returned by :func:`neighbour_pairs`.
+    """
+
+    def __init__(self, id, lat, lon, x=None, y=None):
+        self.id = _int32_ids(id)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        if x is None or y is None:
+            x, y = project(self.lat, self.lon)
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self._order = np.argsort(self.id, kind='stable')
+        self._sorted_id = self.id[self._order]
+
+    @classmethod
+    def from_locations(cls, locations):
+        """A set of the :class:`Location` s, in order (a set is returned as is)."""
+        if isinstance(locations, LocationSet):
+            return locations
+        locations = list(locations)
+        return cls(*([getattr(loc, field) for loc in locations] for field in Location._fields))
+
+    def __len__(self):
+        return len(self.id)
+
+    def __iter__(self):
+        return (self[k] for k in range(len(self)))
+
+    def __getitem__(self, k):
+        if isinstance(k, (int, np.integer)):
+            return Location(int(self.id[k]), float(self.lat[k]), float(self.lon[k]), float(self.x[k]),
+                            float(self.y[k]))
+        return LocationSet(self.id[k], self.lat[k], self.lon[k], self.x[k], self.y[k])
+
+    def rows(self, ids):
+        """Rows of the ``ids`` (the first one, for repeated ids); ``KeyError`` if any is missing."""
+        ids = np.asarray(ids)
+        k = np.minimum(np.searchsorted(self._sorted_id, ids), max(len(self) - 1, 0))
+        if len(self) == 0 and ids.size > 0 or np.any(self._sorted_id[k] != ids):
+            raise KeyError("Location ids not in the set.")
+        return self._order[k]
+
+
+def _pair_rows(location_pair_list, locations=None):
+    # the pairs as rows of a LocationSet, either from (i, j) id arrays and their locations, or from Location pairs
+    if _is_pair_arrays(location_pair_list):
+        if locations is None:
+            raise ValueError("Pairs of ids need their locations.")
+        locations = LocationSet.from_locations(locations)
+        i, j = location_pair_list
+        return locations, locations.rows(i), locations.rows(j)
+    if locations is None:
+        locations = {}
+        for pair in location_pair_list:
+            for loc in pair:
+                locations.setdefault(loc.id, loc)
+        locations = locations.values()
+    locations = LocationSet.from_locations(locations)
+    return (locations, locations.rows([i.id for i, _ in location_pair_list]),
+            locations.rows([j.id for _, j in location_pair_list]))
 
-data_path = 'osrm.csv'
 
+def _is_pair_arrays(pairs):
+    return isinstance(pairs, tuple) and len(pairs) == 2 and all(isinstance(a, np.ndarray) for a in pairs)
 
-def osrm_time_row(locations):
+
+def osrm_time_row(locations, session=None):
     assert len(locations) <= 8_000, "Limit over maximum allowed."
     assert len(locations) >= 2, "More than one location is needed."
-    str_locations = ';'.join(['%0.6f,%0.6f' % (loc.lon, loc.lat) for loc in locations])
-    r = requests.get('http://localhost:5000/table/v1/driving/' + str_locations + '?sources=0')
+    locations = LocationSet.from_locations(locations)
+    r = (session or requests).get(server + '/table/v1/driving/' + _coordinates(locations.lon, locations.lat) +
+                                  '?sources=0')
+    r.raise_for_status()
     return r.json()['durations'][0][1:]
 
 
-def osrm_time_matrix_batch_query(location_pair_list, query_limit=4_000):
+def _coordinates(lon, lat):
+    return ';'.join(['%0.6f,%0.6f' % coordinates for coordinates in zip(lon.tolist(), lat.tolist())])
+
+
+def osrm_time_table(block, session=None):
+    """Durations from every source to every destination of ``block``, as a list of rows."""
+    ids = np.concatenate([block.sources.id, block.destinations.id])
+    _, first, index = np.unique(ids, return_index=True, return_inverse=True)
+    assert len(first) <= 8_000, "Limit over maximum allowed."
+    lon = np.concatenate([block.sources.lon, block.destinations.lon])[first]
+    lat = np.concatenate([block.sources.lat, block.destinations.lat])[first]
+    sources = ';'.join(map(str, index[:len(block.sources)].tolist()))
+    destinations = ';'.join(map(str, index[len(block.sources):].tolist()))
+    r = (session or requests).get(server + '/table/v1/driving/' + _coordinates(lon, lat) +
+                                  '?sources=' + sources + '&destinations=' + destinations)
+    r.raise_for_status()
+    return r.json()['durations']
+
+
+def _retry(function, *args, retries=3, backoff=0.5):
+    # failed requests and error responses (no durations) are retried after backoff, 2 * backoff, 4 * backoff, ...
+    for attempt in range(retries + 1):
+        try:
+            return function(*args)
+        except (requests.RequestException, KeyError, ValueError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def _query_concurrently(query, arguments, max_in_flight, retries, backoff, errors='raise'):
+    # with errors='skip', the exception of a request that failed every retry is yielded in place of its result
+    assert max_in_flight >= 1, "At least one request must be in flight."
+    if errors not in ('raise', 'skip'):
+        raise NotImplementedError(f"Errors '{errors}' not supported.")
+
+    def attempt(argument):
+        try:
+            return _retry(query, argument, session, retries=retries, backoff=backoff)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            if errors == 'raise':
+                raise
+            return e
+
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            # at most 2 * max_in_flight requests are submitted and not yet consumed, so results do not pile up
+            pending = deque()
+            try:
+                for argument in arguments:
+                    pending.append(pool.submit(attempt, argument))
+                    if len(pending) == 2 * max_in_flight:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+def osrm_time_rows(location_lists, max_in_flight=8, retries=3, backoff=0.5, errors='raise'):
+    """Yield :func:`osrm_time_row` of every list in ``location_lists``, in order.
+
+    Up to ``max_in_flight`` requests run at once, on threads sharing one keep-alive session. Failed requests are
+    retried ``retries`` times, after ``backoff``, ``2 * backoff``, ... seconds; if they still fail, ``errors='raise'``
+    raises the error and ``'skip'`` yields it in place of the row.
+    """
+    yield from _query_concurrently(osrm_time_row, location_lists, max_in_flight, retries, backoff, errors)
+
+
+def osrm_time_tables(blocks, max_in_flight=8, retries=3, backoff=0.5, errors='raise'):
+    """Yield :func:`osrm_time_table` of every block, in order; see :func:`osrm_time_rows`."""
+    yield from _query_concurrently(osrm_time_table, blocks, max_in_flight, retries, backoff, errors)
+
+
+def _timed_time_table(block, session):
+    start = time.perf_counter()
+    return osrm_time_table(block, session), time.perf_counter() - start
+
+
+def plan_blocks(location_pair_list, query_limit=4_000, tile=2_000, min_density=0.25, locations=None):
+    """Group the pairs into :class:`Block` s of at most ``query_limit`` distinct locations each.
+
+    Origins are visited tile by tile (``tile`` meters on the ``x``/``y`` projection), snaking across the rows of tiles,
+    and added to the current block while its sources and destinations fit in one request and at least ``min_density``
+    of its sources x destinations table are requested pairs. Neighbouring origins share most of their destinations, so
+    blocks stay spatially tight and dense. An origin with more destinations than fit in one request gets blocks of its
+    own, as rows.
+
+    The pairs are :class:`Location` pairs, or ``(i, j)`` id arrays of ``locations`` (a :class:`LocationSet`). Blocks
+    hold their sources and destinations as :class:`LocationSet` s and their pairs as ``(i, j)`` id arrays.
+    """
+    locations, i, j = _pair_rows(location_pair_list, locations)
+    n = len(locations)
+    key = np.unique(i.astype(np.int64) * n + j)
+    i, j = key // n, key % n
+    origins, starts = np.unique(i, return_index=True)
+    ends = np.append(starts[1:], len(i))
+    row = np.floor(locations.y[origins] / tile).astype(np.int64)
+    col = np.floor(locations.x[origins] / tile).astype(np.int64)
+    in_block = np.zeros(n, dtype=bool)  # the locations of the current block
+    is_target = np.zeros(n, dtype=bool)  # its destinations
+    block, n_locations, n_targets, n_pairs = [], 0, 0, 0
+    for k in np.lexsort((np.where(row % 2 == 0, col, -col), row)):
+        origin, dests = origins[k], j[starts[k]:ends[k]]
+        new = np.union1d(dests, origin)
+        n_new = np.count_nonzero(~in_block[new])
+        n_new_targets = np.count_nonzero(~is_target[dests])
+        if len(block) > 0 and (n_locations + n_new > query_limit or
+                               n_pairs + len(dests) < min_density * (len(block) + 1) * (n_targets + n_new_targets)):
+            yield _block(locations, i, j, np.concatenate([np.arange(starts[b], ends[b]) for b in block]))
+            in_block[:] = False
+            is_target[:] = False
+            block, n_locations, n_targets, n_pairs = [], 0, 0, 0
+            n_new, n_new_targets = len(new), len(dests)
+        if n_new > query_limit:
+            for start in range(starts[k], ends[k], query_limit - 1):
+                yield _block(locations, i, j, np.arange(start, min(start + query_limit - 1, ends[k])))
+            continue
+        block.append(k)
+        in_block[new] = True
+        is_target[dests] = True
+        n_locations += n_new
+        n_targets += n_new_targets
+        n_pairs += len(dests)
+    if len(block) > 0:
+        yield _block(locations, i, j, np.concatenate([np.arange(starts[b], ends[b]) for b in block]))
+
+
+def _block(locations, i, j, pairs):
+    i, j = i[pairs], j[pairs]
+    return Block(locations[np.unique(i)], locations[np.unique(j)], (locations.id[i], locations.id[j]))
+
+
+def osrm_time_matrix_batch_query(location_pair_list, query_limit=4_000, max_in_flight=8, locations=None,
+                                 symmetric=False, resume=False, retries=3, backoff=0.5, errors='raise', callback=None,
+                                 writer=None, latency_window=1_000):
+    """Query and save the durations of the pairs; return them as a ``np.float32`` array, in the order of the pairs.
+
+    The pairs are :class:`Location` pairs, or ``(i, j)`` id arrays of ``locations`` (a :class:`LocationSet`). With
+    ``symmetric``, only the direction from the smaller id to the larger one is queried and saved, and its duration is
+    returned for both.
+
+    Every block is saved to the cache as soon as it arrives, so with ``resume`` an interrupted run picks up where it
+    stopped: pairs already cached (in either direction, with ``symmetric``) are returned without querying them again.
+    Failed requests are retried as in :func:`osrm_time_tables`; with ``errors='skip'``, the pairs of a block that
+    still fails are left ``nan`` and uncached, for a later run to resume. After every block, the :class:`Progress` of
+    the run is passed to ``callback``, if given, and logged at most once per percent. Its latency percentiles (in
+    seconds) are those of the last ``latency_window`` requests. The queried durations are also written to ``writer``
+    (a :class:`DurationWriter`), if given.
+    """
     assert query_limit <= 8_000, "Limit over maximum allowed."
-    assert query_limit >= 1, "Limit must be positive."
+    assert query_limit >= 2, "Limit must allow an origin and a destination."
     assert query_limit == int(query_limit), " Limit must be integer."
-    assert len(location_pair_list) > 0, "Not enough requests."
-    location_pair_list = sorted(location_pair_list)
-    origin = None
-    destinations = []
-    n_pairs = len(location_pair_list)
-    progress_print = None
-    for k, (loc1, loc2) in enumerate(location_pair_list):
-        # check if origin changed
-        if origin != loc1:
-            if len(destinations) > 0:
-                res = osrm_time_row([origin] + destinations)
-                save_response(origin, destinations, res)
-            origin = loc1
-            destinations = [loc2]
+    if errors not in ('raise', 'skip'):
+        raise NotImplementedError(f"Errors '{errors}' not supported.")
+    locations, i, j = _pair_rows(location_pair_list, locations)
+    assert len(i) > 0, "Not enough requests."
+    if symmetric:
+        i, j = _one_direction(locations, i, j)
+    n = len(locations)
+    keys, inverse = np.unique(i.astype(np.int64) * n + j, return_inverse=True)
+    rows, cols = keys // n, keys % n
+    durations = np.full(len(keys), np.nan, dtype=np.float32)
+    todo = np.ones(len(keys), dtype=bool)
+    with _open_cache() as cache:
+        if resume:
+            for a, b in [(rows, cols), (cols, rows)] if symmetric else [(rows, cols)]:
+                k = np.flatnonzero(todo)
+                cached, found = cache._lookup((locations.id[a[k]], locations.id[b[k]]))
+                durations[k[found]] = cached[found]
+                todo[k[found]] = False
+        hits = len(keys) - np.count_nonzero(todo)
+        blocks = []
+        if hits < len(keys):
+            blocks = list(plan_blocks((locations.id[rows[todo]], locations.id[cols[todo]]), query_limit,
+                                      locations=locations))
+        start = time.perf_counter()
+        latencies = deque(maxlen=latency_window)
+        n_done = n_requests = n_failed = 0
+        progress_print = None
+        for block, res in zip(blocks, _query_concurrently(_timed_time_table, blocks, max_in_flight, retries, backoff,
+                                                          errors)):
+            n_requests += 1
+            if isinstance(res, Exception):
+                n_failed += 1
+                logger.warning('Block of %d pairs failed: %s', len(block.pairs[0]), res)
+            else:
+                table, latency = res
+                latencies.append(latency)
+                response = _block_durations(block, table)
+                _save(*block.pairs, response, cache)
+                if writer is not None:
+                    writer.add(*block.pairs, response)
+                k = locations.rows(block.pairs[0]).astype(np.int64) * n + locations.rows(block.pairs[1])
+                durations[np.searchsorted(keys, k)] = response
+            n_done += len(block.pairs[0])
+            percent = round((hits + n_done) / len(keys) * 100)
+            log = percent != progress_print and logger.isEnabledFor(logging.INFO)
+            progress_print = percent
+            if callback is None and not log:
+                continue
+            progress = _progress(hits + n_done, len(keys), n_requests, n_failed, time.perf_counter() - start, n_done,
+                                 latencies, hits)
+            if callback is not None:
+                callback(progress)
+            if log:
+                logger.info('%d%%: %d/%d pairs, %.1f requests/s, %.0f pairs/s, p95 latency %.2f s, '
+                            'cache hit rate %.0f%%, %d failed', percent, progress.pairs, progress.total,
+                            progress.requests_per_second, progress.pairs_per_second, progress.latency_p95,
+                            progress.cache_hit_rate * 100, progress.failed)
+    return durations[inverse]
+
+
+def _progress(pairs, total, requests, failed, elapsed, queried, latencies, hits):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) > 0 else (np.nan,) * 3
+    return Progress(pairs=pairs, total=total, requests=requests, failed=failed, elapsed=elapsed,
+                    requests_per_second=requests / elapsed, pairs_per_second=queried / elapsed,
+                    latency_p50=float(p50), latency_p95=float(p95), latency_p99=float(p99),
+                    cache_hit_rate=hits / total)
+
+
+def _one_direction(locations, i, j):
+    # the pairs from the smaller id to the larger one
+    swap = locations.id[i] > locations.id[j]
+    return np.where(swap, j, i), np.where(swap, i, j)
+
+
+class TravelTimeCache:
+    """Durations of ``(i, j)`` location id pairs, kept in an SQLite table keyed on ``(i, j)``.
+
+    Appends commit one batch at a time, and lookups go through the primary key index, so neither needs to read the
+    whole cache. Saving a pair again replaces its duration. Use as a context manager to close the connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS durations '
+                                '(i INTEGER NOT NULL, j INTEGER NOT NULL, duration REAL, PRIMARY KEY (i, j)) '
+                                'WITHOUT ROWID')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM durations').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, i, j, durations):
+        """Save ``durations[k]`` as the duration from location id ``i[k]`` to ``j[k]``."""
+        i, j, durations = np.asarray(i), np.asarray(j), np.asarray(durations, dtype=float)
+        order = np.lexsort((j, i))  # insert in key order; the sort is stable, so the last duplicate wins
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO durations VALUES (?, ?, ?)',
+                                        zip(i[order].tolist(), j[order].tolist(), durations[order].tolist()))
+
+    def lookup(self, pairs):
+        """Durations of the id ``pairs``, ``nan`` where they are not cached.
+
+        ``pairs`` is either two id arrays ``(i, j)`` or an ``n x 2`` array.
+        """
+        return self._lookup(pairs)[0]
+
+    def _lookup(self, pairs):
+        # durations and whether each pair is cached (OSRM answers null, stored as nan, for unreachable pairs)
+        if not _is_pair_arrays(pairs):
+            pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2).T
+        i, j = pairs
+        durations = np.full(len(i), np.nan)
+        found = np.zeros(len(i), dtype=bool)
+        with self.connection:
+            self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS query '
+                                    '(k INTEGER PRIMARY KEY, i INTEGER, j INTEGER)')
+            self.connection.executemany('INSERT INTO query VALUES (?, ?, ?)',
+                                        zip(range(len(i)), i.tolist(), j.tolist()))
+            rows = self.connection.execute('SELECT query.k, durations.duration FROM query JOIN durations '
+                                           'ON durations.i = query.i AND durations.j = query.j').fetchall()
+            self.connection.execute('DELETE FROM query')
+        if len(rows) > 0:
+            k, duration = zip(*rows)
+            durations[list(k)] = np.array(duration, dtype=float)
+            found[list(k)] = True
+        return durations, found
+
+    def import_csv(self, csv_path, chunksize=1_000_000):
+        """Add the ``i,j,response`` rows of a CSV (earlier versions of this module, or a :class:`DurationWriter`).
+
+        Later rows win.
+        """
+        for chunk in pd.read_csv(csv_path, header=None, names=['i', 'j', 'response'], chunksize=chunksize):
+            self.add(chunk['i'].to_numpy(), chunk['j'].to_numpy(), chunk['response'].to_numpy())
+
+
+class DurationWriter:
+    """Buffered writer of ``(i, j, duration)`` rows to one open file, in ``'csv'`` or ``'binary'`` format.
+
+    Rows are gathered in preallocated arrays of ``buffer_size`` rows and appended a whole buffer at a time; closing
+    writes what is left and syncs the file to disk. CSV rows read as ``i,j,duration`` (see
+    :meth:`TravelTimeCache.import_csv`), binary files as ``np.fromfile(path, dtype=DurationWriter.dtype)``. Use as a
+    context manager, passing the writer to :func:`osrm_time_matrix_batch_query` or as the ``cache`` of
+    :func:`save_block`.
+    """
+
+    dtype = np.dtype([('i', np.int32), ('j', np.int32), ('duration', np.float32)])
+
+    def __init__(self, path, format='csv', buffer_size=1_000_000):
+        if format not in ('csv', 'binary'):
+            raise NotImplementedError(f"Format '{format}' not supported.")
+        self.path = path
+        self.format = format
+        self.file = open(path, 'a' if format == 'csv' else 'ab')
+        self.buffer = np.empty(buffer_size, dtype=self.dtype)
+        self.n = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, i, j, durations):
+        """Write ``durations[k]`` as the duration from location id ``i[k]`` to ``j[k]``."""
+        i, j, durations = _int32_ids(i), _int32_ids(j), np.asarray(durations, dtype=float)
+        start = 0
+        while start < len(i):
+            m = min(len(i) - start, len(self.buffer) - self.n)
+            rows = self.buffer[self.n:self.n + m]
+            rows['i'], rows['j'], rows['duration'] = i[start:start + m], j[start:start + m], durations[start:start + m]
+            self.n += m
+            start += m
+            if self.n == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """Append the buffered rows to the file."""
+        if self.format == 'csv':
+            np.savetxt(self.file, self.buffer[:self.n], fmt='%d,%d,%.9g')
         else:
-            destinations.append(loc2)
-        # check if the query limit is reached or end of location pair list
-        if len(destinations) == query_limit or k + 1 == len(location_pair_list):
-            res = osrm_time_row([origin] + destinations)
-            save_response(origin, destinations, res)
-            origin = None
-            destinations = []
-        progress = round((k + 1) / n_pairs * 100)
-        if progress != progress_print:
-            progress_print = progress
-            print(f'{progress_print}%')
-    return None
+            self.buffer[:self.n].tofile(self.file)
+        self.file.flush()
+        self.n = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+def _open_cache():
+    # the TravelTimeCache at data_path; the first time, it takes in the osrm.csv that earlier versions appended to
+    path, csv_path = data_path, os.path.splitext(data_path)[0] + '.csv'
+    if path == csv_path:
+        path = os.path.splitext(data_path)[0] + '.db'
+        logger.warning('data_path %s is a CSV file; durations are now cached in %s', data_path, path)
+    new = not os.path.isfile(path)
+    cache = TravelTimeCache(path)
+    if new and os.path.isfile(csv_path):
+        logger.warning('Importing the durations of %s into %s', csv_path, path)
+        cache.import_csv(csv_path)
+    return cache
+
 
+def save_response(origin, destinations, response, cache=None):
+    """Save the durations from ``origin`` to ``destinations`` in ``cache``.
 
-def save_response(origin, destinations, response):
+    By default this is the :class:`TravelTimeCache` at ``data_path``, no longer an appended CSV file. Pass a
+    :class:`DurationWriter` as ``cache`` to keep writing CSV rows.
+    """
     n = len(destinations)
     i_list = [origin.id for _ in range(n)]
     j_list = [destination.id for destination in destinations]
-    df = pd.DataFrame({'i': i_list, 'j': j_list, 'response': response})
-    with open(data_path, 'a') as f:
-        df.to_csv(f, header=False, index=False)
+    _save(i_list, j_list, response, cache)
     return None
 
 
-def osrm_time_matrix(location_pair_list):
-    if not os.path.isfile(data_path):
-        osrm_time_matrix_batch_query(location_pair_list)
-    else:
-        df1 = pd.DataFrame({'i': [i.id for i, _ in location_pair_list],
-                            'j': [j.id for _, j in location_pair_list]})
-        df2 = pd.read_csv(data_path, header=None, usecols=[0, 1], names=['i', 'j'],
-                          dtype={'i': np.int32, 'j': np.int32})
-        df_all = df1.merge(df2.drop_duplicates(), on=['i', 'j'], how='left', indicator=True)
-        df_empties = df_all[df_all['_merge'] == 'left_only']
-        locations = {}
-        for l1, l2 in location_pair_list:
-            locations[l1.id] = l1
-            locations[l2.id] = l2
-        new_location_pair_list = []
-        for k, row in df_empties.iterrows():
-            new_location_pair_list.append((locations[row.i], locations[row.j]))
-        if len(new_location_pair_list) > 0:
-            osrm_time_matrix_batch_query(new_location_pair_list)
+def save_block(block, response, cache=None):
+    """Save the durations of the pairs requested in ``block`` (not the whole table)."""
+    _save(*block.pairs, _block_durations(block, response), cache)
     return None
+
+
+def _block_durations(block, response):
+    # durations of the requested pairs, picked from the sources x destinations table
+    return np.array(response, dtype=float)[block.sources.rows(block.pairs[0]), block.destinations.rows(block.pairs[1])]
+
+
+def _save(i_list, j_list, response, cache=None):
+    if cache is not None:
+        cache.add(i_list, j_list, response)
+        return
+    with _open_cache() as cache:
+        cache.add(i_list, j_list, response)
+
+
+def osrm_time_matrix(location_pair_list, locations=None, sparse=False, symmetric=False, estimate_below=None,
+                     speed=30 / 3.6, errors='raise', callback=None):
+    """Durations of the pairs, from the cache at ``data_path`` or queried (and cached) when missing.
+
+    The pairs are :class:`Location` pairs, or ``(i, j)`` id arrays of ``locations``. Returns a :class:`TimeMatrix`
+    whose ``durations[a, b]`` is the duration from ``locations[a]`` to ``locations[b]``, with ``locations`` as a
+    :class:`LocationSet` (by default, the locations of the pairs in order of appearance). The matrix is a dense
+    ``np.float32`` array with ``nan`` outside the requested pairs or, with ``sparse``, a ``scipy.sparse`` CSR matrix
+    holding only the requested pairs. Unreachable pairs are ``nan`` in both.
+
+    With ``symmetric``, a pair takes the duration of its reverse when that one is cached, only one direction of the
+    missing pairs is queried and cached (see :func:`osrm_time_matrix_batch_query`), and the matrix holds the reverse
+    of every pair too. Pairs closer than ``estimate_below`` meters on the ``x``/``y`` projection are neither looked up
+    nor queried: their duration is the straight line distance at ``speed`` (meters per second). ``errors`` and
+    ``callback`` are passed on to :func:`osrm_time_matrix_batch_query`, which resumes from the cache.
+    """
+    if sparse and sp is None:
+        raise ImportError("scipy is required for sparse matrices.")
+    locations, i, j = _pair_rows(location_pair_list, locations)
+    durations = np.full(len(i), np.nan, dtype=np.float32)
+    estimated = np.zeros(len(i), dtype=bool)
+    if estimate_below is not None:
+        distance = np.hypot(locations.x[i] - locations.x[j], locations.y[i] - locations.y[j])
+        estimated = distance < estimate_below
+        durations[estimated] = distance[estimated] / speed
+    missing = np.flatnonzero(~estimated)
+    if len(missing) > 0:
+        durations[missing] = osrm_time_matrix_batch_query((locations.id[i[missing]], locations.id[j[missing]]),
+                                                          locations=locations, symmetric=symmetric, resume=True,
+                                                          errors=errors, callback=callback)
+    if symmetric:
+        # the reverse pairs go first, so that requested pairs win
+        i, j, durations = np.concatenate([j, i]), np.concatenate([i, j]), np.concatenate([durations, durations])
+    n = len(locations)
+    if sparse:
+        _, unique = np.unique((i.astype(np.int64) * n + j)[::-1], return_index=True)
+        unique = len(i) - 1 - unique
+        matrix = sp.csr_matrix((durations[unique], (i[unique], j[unique])), shape=(n, n), dtype=np.float32)
+    else:
+        matrix = np.full((n, n), np.nan, dtype=np.float32)
+        matrix[i, j] = durations
+    return TimeMatrix(locations, matrix)
@@ -0,0 +1,334 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+
+from industrialucn.experimental import osrm
+from industrialucn.experimental.osrm import Location
+
+
+def duration(origin, destination):
+    # stand-in travel time: a Manhattan distance in degrees, in seconds, between the coordinates as sent (6 decimals)
+    origin, destination = ([float('%0.6f' % c) for c in point] for point in (origin, destination))
+    return round(1000 * (abs(origin[0] - destination[0]) + abs(origin[1] - destination[1])), 1)
+
+
+class OsrmStandIn(BaseHTTPRequestHandler):
+    """Answers ``/table/v1/driving/{lon},{lat};...`` like OSRM's table service, honouring sources and destinations."""
+
+    requests = []
+    failures = 0  # number of requests to answer with an error before answering normally
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        with self.lock:
+            type(self).requests.append(self.path)
+            fail = type(self).failures > 0
+            if fail:
+                type(self).failures -= 1
+        if fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        assert url.path.startswith('/table/v1/driving/')
+        coordinates = [tuple(map(float, c.split(','))) for c in url.path[len('/table/v1/driving/'):].split(';')]
+        query = parse_qs(url.query)
+        everything = ';'.join(map(str, range(len(coordinates))))
+        sources = [int(i) for i in query.get('sources', [everything])[0].split(';')]
+        destinations = [int(i) for i in query.get('destinations', [everything])[0].split(';')]
+        body = json.dumps({'code': 'Ok',
+                           'durations': [[duration(coordinates[i], coordinates[j]) for j in destinations]
+                                         for i in sources]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def grid_locations(n):
+    rnd_state = np.random.RandomState(0)
+    lat = -23.65 + rnd_state.rand(n) * 0.05
+    lon = -70.40 + rnd_state.rand(n) * 0.05
+    return [Location(id=i, lat=lat[i], lon=lon[i], x=(lon[i] + 70.40) * 102_000, y=(lat[i] + 23.65) * 111_000)
+            for i in range(n)]
+
+
+class Osrm(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = ThreadingHTTPServer(('127.0.0.1', 0), OsrmStandIn)
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.server = osrm.server
+        osrm.server = f'http://127.0.0.1:{cls.httpd.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        osrm.server = cls.server
+
+    def setUp(self):
+        OsrmStandIn.requests = []
+        OsrmStandIn.failures = 0
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = osrm.data_path
+        osrm.data_path = os.path.join(self.directory.name, 'osrm.db')
+
+    def tearDown(self):
+        osrm.data_path = self.data_path
+        self.directory.cleanup()
+
+    def test_time_rows(self):
+        locations = grid_locations(30)
+        lists = [locations[i:i + 5] for i in range(0, 26)]
+        OsrmStandIn.failures = 3
+        rows = list(osrm.osrm_time_rows(lists, max_in_flight=4, backoff=0.01))
+        self.assertEqual(len(OsrmStandIn.requests), len(lists) + 3)
+        for row, locs in zip(rows, lists):
+            self.assertEqual(row, [duration((locs[0].lon, locs[0].lat), (loc.lon, loc.lat)) for loc in locs[1:]])
+        OsrmStandIn.failures = 10
+        with self.assertRaises(requests.HTTPError):
+            list(osrm.osrm_time_rows(lists[:1], retries=2, backoff=0.01))
+        # a slow consumer holds back the requests: at most 2 * max_in_flight are submitted ahead
+        OsrmStandIn.requests, OsrmStandIn.failures = [], 0
+        rows = osrm.osrm_time_rows(lists, max_in_flight=2)
+        next(rows)
+        time.sleep(0.2)
+        self.assertLessEqual(len(OsrmStandIn.requests), 4)
+        rows.close()
+
+    def test_time_matrix(self):
+        locations = grid_locations(40)
+        pairs = [(l1, l2) for l1 in locations for l2 in locations if l1 != l2 and abs(l1.x - l2.x) <= 1_000]
+        expected = [duration((l1.lon, l1.lat), (l2.lon, l2.lat)) for l1, l2 in pairs]
+        first = osrm.osrm_time_matrix(pairs[:len(pairs) // 2])
+        # cached and freshly queried durations together, in the order of the given locations
+        result = osrm.osrm_time_matrix(pairs, locations=locations[::-1])
+        # many-to-many tables: far fewer requests than origins
+        self.assertLessEqual(len(OsrmStandIn.requests), 2)
+        self.assertEqual(result.durations.dtype, np.float32)
+        self.assertEqual(result.durations.shape, (40, 40))
+        index = {loc: a for a, loc in enumerate(result.locations)}
+        self.assertEqual(index[locations[0]], 39)
+        np.testing.assert_array_equal(result.durations[[index[l1] for l1, _ in pairs], [index[l2] for _, l2 in pairs]],
+                                      np.float32(expected))
+        self.assertEqual(np.count_nonzero(~np.isnan(result.durations)), len(pairs))
+        index = {loc: a for a, loc in enumerate(first.locations)}
+        np.testing.assert_array_equal(first.durations[[index[l1] for l1, _ in pairs[:len(pairs) // 2]],
+                                                      [index[l2] for _, l2 in pairs[:len(pairs) // 2]]],
+                                      np.float32(expected[:len(pairs) // 2]))
+        sparse = osrm.osrm_time_matrix(pairs + pairs[:3], locations=locations, sparse=True)
+        self.assertLessEqual(len(OsrmStandIn.requests), 2)
+        self.assertEqual(sparse.durations.nnz, len(pairs))
+        np.testing.assert_array_equal(sparse.durations[[l1.id for l1, _ in pairs], [l2.id for _, l2 in pairs]].A1,
+                                      np.float32(expected))
+        with osrm.TravelTimeCache(osrm.data_path) as cache:
+            self.assertEqual(len(cache), len(pairs))
+            np.testing.assert_array_equal(cache.lookup([(l1.id, l2.id) for l1, l2 in pairs]), expected)
+
+    def test_symmetric(self):
+        locations = osrm.LocationSet.from_locations(grid_locations(60))
+        i, j = osrm.neighbour_pairs(locations.x, locations.y, 1_000, ids=locations.id)
+        # one direction is cached already, the other is mirrored from it
+        osrm.osrm_time_matrix((i[:10], j[:10]), locations)
+        n_requests = len(OsrmStandIn.requests)
+        result = osrm.osrm_time_matrix((j[:10], i[:10]), locations, symmetric=True)
+        self.assertEqual(len(OsrmStandIn.requests), n_requests)
+        rows, cols = locations.rows(i[:10]), locations.rows(j[:10])
+        np.testing.assert_array_equal(result.durations[cols, rows], result.durations[rows, cols])
+        result = osrm.osrm_time_matrix((i, j), locations, symmetric=True)
+        with osrm.TravelTimeCache(osrm.data_path) as cache:
+            self.assertEqual(len(cache), len(i) // 2 + np.count_nonzero(i[:10] > j[:10]))
+        rows, cols = locations.rows(i), locations.rows(j)
+        expected = [duration((locations.lon[a], locations.lat[a]), (locations.lon[b], locations.lat[b]))
+                    for a, b in zip(rows, cols)]
+        np.testing.assert_array_equal(result.durations[rows, cols], np.float32(expected))
+        np.testing.assert_array_equal(result.durations, result.durations.T)
+
+    def test_estimate_below(self):
+        locations = osrm.LocationSet.from_locations(grid_locations(60))
+        i, j = osrm.neighbour_pairs(locations.x, locations.y, 1_000, ids=locations.id)
+        rows, cols = locations.rows(i), locations.rows(j)
+        distance = np.hypot(locations.x[rows] - locations.x[cols], locations.y[rows] - locations.y[cols])
+        result = osrm.osrm_time_matrix((i, j), locations, estimate_below=500, speed=10.0)
+        short = distance < 500
+        self.assertTrue(0 < np.count_nonzero(short) < len(i))
+        np.testing.assert_allclose(result.durations[rows[short], cols[short]], distance[short] / 10.0, rtol=1e-6)
+        with osrm.TravelTimeCache(osrm.data_path) as cache:
+            self.assertEqual(len(cache), np.count_nonzero(~short))
+
+    def test_resume(self):
+        locations = osrm.LocationSet.from_locations(grid_locations(60))
+        i, j = osrm.neighbour_pairs(locations.x, locations.y, 1_000, ids=locations.id)
+        OsrmStandIn.failures = 2
+        progress = []
+        with self.assertLogs('osrm', 'INFO') as logs:
+            durations = osrm.osrm_time_matrix_batch_query((i, j), query_limit=20, max_in_flight=1, locations=locations,
+                                                          retries=0, errors='skip', callback=progress.append)
+        warnings = [record.getMessage() for record in logs.records if record.levelname == 'WARNING']
+        self.assertEqual(len(warnings), 2)
+        n_requests = len(OsrmStandIn.requests)
+        self.assertEqual(progress[-1].requests, n_requests)
+        self.assertEqual(progress[-1].failed, 2)
+        self.assertEqual(progress[-1].pairs, progress[-1].total)
+        self.assertEqual(progress[-1].cache_hit_rate, 0.0)
+        self.assertGreater(progress[-1].latency_p95, 0.0)
+        failed = np.isnan(durations)
+        self.assertTrue(0 < np.count_nonzero(failed) < len(i))
+        with osrm.TravelTimeCache(osrm.data_path) as cache:
+            self.assertEqual(len(cache), np.count_nonzero(~failed))
+        # the rerun only queries what failed
+        progress = []
+        durations = osrm.osrm_time_matrix_batch_query((i, j), query_limit=20, locations=locations, resume=True,
+                                                      callback=progress.append)
+        self.assertFalse(np.any(np.isnan(durations)))
+        self.assertAlmostEqual(progress[-1].cache_hit_rate, 1 - np.count_nonzero(failed) / len(i))
+        self.assertLessEqual(len(OsrmStandIn.requests) - n_requests, np.count_nonzero(failed))
+        with self.assertRaises(NotImplementedError):
+            osrm.osrm_time_matrix_batch_query((i, j), locations=locations, errors='ignore')
+
+    def test_writer(self):
+        locations = osrm.LocationSet.from_locations(grid_locations(40))
+        i, j = osrm.neighbour_pairs(locations.x, locations.y, 1_000, ids=locations.id)
+        for format in ('csv', 'binary'):
+            path = os.path.join(self.directory.name, 'durations.' + format)
+            with osrm.DurationWriter(path, format, buffer_size=7) as writer:
+                durations = osrm.osrm_time_matrix_batch_query((i, j), query_limit=20, locations=locations,
+                                                              writer=writer)
+                self.assertEqual(os.path.getsize(path) > 0, len(i) >= 7)
+                unflushed = writer.n
+            self.assertEqual(unflushed, len(i) % 7)
+            if format == 'csv':
+                with osrm.TravelTimeCache(os.path.join(self.directory.name, 'imported.db')) as cache:
+                    cache.import_csv(path)
+                    np.testing.assert_array_equal(np.float32(cache.lookup((i, j))), durations)
+            else:
+                rows = np.fromfile(path, dtype=osrm.DurationWriter.dtype)
+                order = np.lexsort((rows['j'], rows['i']))
+                np.testing.assert_array_equal(rows['i'][order], i)
+                np.testing.assert_array_equal(rows['j'][order], j)
+                np.testing.assert_array_equal(rows['duration'][order], durations)
+        with self.assertRaises(NotImplementedError):
+            osrm.DurationWriter(os.path.join(self.directory.name, 'durations.parquet'), 'parquet')
+        path = os.path.join(self.directory.name, 'precision.csv')
+        values = np.float32([1 / 3, 12345.678, 0.1])
+        with osrm.DurationWriter(path) as writer:
+            writer.add([1, 2, 3], [4, 5, 6], values)
+            with self.assertRaises(ValueError):
+                writer.add([2 ** 31], [1], [1.0])
+        np.testing.assert_array_equal(np.float32(pd.read_csv(path, header=None)[2]), values)
+
+    def test_cache(self):
+        csv_path = os.path.join(self.directory.name, 'osrm.csv')
+        pd.DataFrame({'i': [1, 1, 2, 1], 'j': [2, 3, 1, 2], 'response': [10.0, 20.0, None, 11.0]}).to_csv(
+            csv_path, header=False, index=False)
+        with osrm.TravelTimeCache(osrm.data_path) as cache:
+            cache.import_csv(csv_path, chunksize=2)
+            self.assertEqual(len(cache), 3)
+            np.testing.assert_array_equal(cache.lookup(np.array([[1, 3], [1, 2], [3, 1], [2, 1]], dtype=np.int32)),
+                                          [20.0, 11.0, np.nan, np.nan])
+            cache.add([3], [1], [5.0])
+            np.testing.assert_array_equal(cache.lookup([(3, 1)]), [5.0])
+        # an osrm.csv of earlier versions is imported into a new cache
+        osrm.data_path = os.path.join(self.directory.name, 'migrated.db')
+        pd.DataFrame({'i': [1], 'j': [2], 'response': [7.5]}).to_csv(
+            os.path.join(self.directory.name, 'migrated.csv'), header=False, index=False)
+        with self.assertLogs('osrm', 'WARNING'):
+            result = osrm.osrm_time_matrix([(Location(1, 0, 0, 0, 0), Location(2, 0, 0, 0, 0))])
+        np.testing.assert_array_equal(result.durations, [[np.nan, 7.5], [np.nan, np.nan]])
+        self.assertEqual(len(OsrmStandIn.requests), 0)
+        # a data_path still naming a CSV file is cached beside it
+        osrm.data_path = os.path.join(self.directory.name, 'migrated.csv')
+        with self.assertLogs('osrm', 'WARNING'):
+            result = osrm.osrm_time_matrix([(Location(1, 0, 0, 0, 0), Location(2, 0, 0, 0, 0))])
+        self.assertEqual(result.durations[0, 1], 7.5)
+        self.assertEqual(len(OsrmStandIn.requests), 0)
+        osrm.data_path = os.path.join(self.directory.name, 'osrm.db')
+        # unreachable pairs (null durations) are cached and not queried again
+        osrm.osrm_time_matrix([(Location(2, 0, 0, 0, 0), Location(1, 0, 0, 0, 0))])
+        self.assertEqual(len(OsrmStandIn.requests), 0)
+
+    def test_neighbour_pairs(self):
+        rnd_state = np.random.RandomState(1)
+        lat = -23.65 + rnd_state.rand(300) * 0.05
+        lon = -70.40 + rnd_state.rand(300) * 0.05
+        x, y = osrm.project(lat, lon)
+        self.assertAlmostEqual(y.max() - y.min(), np.radians(np.ptp(lat)) * osrm.EARTH_RADIUS, delta=1e-6)
+        ids = np.arange(1000, 1300)
+        for metric in ('chebyshev', 'euclidean'):
+            i, j = osrm.neighbour_pairs(x, y, 700, ids=ids, metric=metric, chunksize=37)
+            self.assertEqual(i.dtype, np.int32)
+            dx, dy = np.abs(x[:, None] - x[None, :]), np.abs(y[:, None] - y[None, :])
+            near = (dx <= 700) & (dy <= 700) if metric == 'chebyshev' else dx ** 2 + dy ** 2 <= 700 ** 2
+            np.fill_diagonal(near, False)
+            expected_i, expected_j = np.nonzero(near)
+            np.testing.assert_array_equal(i, ids[expected_i])
+            np.testing.assert_array_equal(j, ids[expected_j])
+        with self.assertRaises(NotImplementedError):
+            osrm.neighbour_pairs(x, y, 700, metric='manhattan')
+        with self.assertRaises(ValueError):
+            osrm.neighbour_pairs(x[:2], y[:2], 700, ids=[2 ** 31 + 5, 2 ** 31 + 9])
+
+    def test_plan_blocks(self):
+        locations = osrm.LocationSet.from_locations(grid_locations(200))
+        i, j = osrm.neighbour_pairs(locations.x, locations.y, 1_000, ids=locations.id)
+        pairs = set(zip(i.tolist(), j.tolist()))
+        i, j = np.append(i, i[0]), np.append(j, j[0])
+        for query_limit in (10, 50, 4_000):
+            blocks = list(osrm.plan_blocks((i, j), query_limit, tile=500, locations=locations))
+            planned = [pair for block in blocks for pair in zip(*(ids.tolist() for ids in block.pairs))]
+            self.assertEqual(len(planned), len(pairs))
+            self.assertSetEqual(set(planned), pairs)
+            for block in blocks:
+                self.assertEqual(block.pairs[0].dtype, np.int32)
+                self.assertLessEqual(len(np.union1d(block.sources.id, block.destinations.id)), query_limit)
+                np.testing.assert_array_equal(np.unique(block.pairs[0]), block.sources.id)
+                np.testing.assert_array_equal(np.unique(block.pairs[1]), block.destinations.id)
+            if query_limit == 50:
+                self.assertLess(len(blocks), len(np.unique(i)) / 3)
+        # Location pairs are planned the same way
+        self.assertEqual(len(list(osrm.plan_blocks([(locations[0], locations[1])]))), 1)
+        block = next(osrm.plan_blocks((i, j), 50, locations=locations))
+        table = osrm.osrm_time_table(block)
+        self.assertEqual(len(table), len(block.sources))
+        for k, origin in enumerate(block.sources):
+            self.assertEqual(table[k], [duration((origin.lon, origin.lat), (d.lon, d.lat)) for d in block.destinations])
+
+    def test_location_set(self):
+        locations = osrm.LocationSet([7, 3, 5], [-23.6, -23.65, -23.62], [-70.4, -70.38, -70.39])
+        self.assertEqual(len(locations), 3)
+        self.assertEqual(locations.id.dtype, np.int32)
+        self.assertAlmostEqual(locations.y[1], 0.0)
+        self.assertAlmostEqual(locations.x[0], 0.0)
+        np.testing.assert_array_equal(locations.rows([5, 7, 5]), [2, 0, 2])
+        with self.assertRaises(KeyError):
+            locations.rows([4])
+        self.assertEqual(locations[1], Location(3, -23.65, -70.38, locations.x[1], locations.y[1]))
+        self.assertEqual(list(locations[1:]), [locations[1], locations[2]])
+        self.assertEqual(list(osrm.LocationSet.from_locations(locations)), list(locations))
+        with self.assertRaises(ValueError):
+            osrm.LocationSet([2 ** 40], [0.0], [0.0])
+        matrix = osrm.osrm_time_matrix((np.array([3, 7], dtype=np.int32), np.array([7, 5], dtype=np.int32)),
+                                       locations)
+        self.assertIs(matrix.locations, locations)
+        expected = [duration((-70.38, -23.65), (-70.4, -23.6)), duration((-70.4, -23.6), (-70.39, -23.62))]
+        np.testing.assert_array_equal(matrix.durations[[1, 0], [0, 2]], np.float32(expected))
+        self.assertEqual(np.count_nonzero(~np.isnan(matrix.durations)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
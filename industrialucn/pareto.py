@@ -0,0 +1,319 @@
+from typing import Hashable, Iterable, List
+
+import numpy as np
+
+
+def _dominated_mask(points, rtol, atol, weak, block_size):
+    f = np.asarray(points, dtype=float)
+    n = len(f)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    f = f.reshape(n, -1)
+    p = f.shape[1]
+    tol = atol + rtol * np.abs(f)
+    upper = f + tol  # f_j "<= or close to" f_i  <=>  f_j <= upper_i
+    lower = f - tol  # f_j "< and not close to" f_i  <=>  f_j < lower_i
+    # sort on the first objective: a solution j can only dominate i if f_j0 <= upper_i0 (or < lower_i0 for weak
+    # dominance), so the candidate dominators of i are a prefix of the sorted list
+    order = np.argsort(f[:, 0], kind='stable')
+    f, upper, lower = f[order], upper[order], lower[order]
+    if weak:
+        limit = np.searchsorted(f[:, 0], lower[:, 0], side='left')
+    else:
+        limit = np.searchsorted(f[:, 0], upper[:, 0], side='right')
+    dominated = np.zeros(n, dtype=bool)
+    rows = max(1, min(n, int(np.sqrt(block_size / p))))
+    for r0 in range(0, n, rows):
+        r = slice(r0, min(n, r0 + rows))
+        stop = limit[r].max()
+        cols = max(1, block_size // (p * (r.stop - r.start)))
+        for c0 in range(0, stop, cols):
+            c = slice(c0, min(stop, c0 + cols))
+            if weak:
+                dom = (f[None, c, :] < lower[r, None, :]).all(axis=2)
+            else:
+                dom = ((f[None, c, :] <= upper[r, None, :]).all(axis=2) &
+                       (f[None, c, :] < lower[r, None, :]).any(axis=2))
+            dominated[r] |= dom.any(axis=1)
+            if dominated[r].all():
+                break
+    mask = np.empty(n, dtype=bool)
+    mask[order] = dominated
+    return mask
+
+
+def pareto_filter(points, rtol: float = 1e-05, atol: float = 1e-08, weak: bool = False,
+                  block_size: int = 2 ** 22) -> np.ndarray:
+    """Return the indices of the non-dominated rows of ``points`` (minimization).
+
+    Two values are considered equal when they are close in the sense of ``np.isclose(f_j, f_i, rtol, atol)``, so
+    duplicated solutions do not dominate each other. With ``weak=True`` only strict dominance (better in every
+    objective) is filtered out. Comparisons are broadcast in blocks of at most ``block_size`` elements.
+    """
+    return np.flatnonzero(~_dominated_mask(points, rtol, atol, weak, block_size))
+
+
+class _SortedFront:
+    """Non-dominated set of a bi-objective problem, kept sorted by the first objective.
+
+    In a non-dominated set the second objective decreases as the first increases, so both the dominance test of a new
+    point and the range of points it dominates are found by binary search.
+    """
+
+    def __init__(self, rtol: float, atol: float):
+        self.rtol = rtol
+        self.atol = atol
+        self.f = np.empty((0, 2))
+        self.keys = []
+
+    def __len__(self):
+        return len(self.f)
+
+    def _upper(self, f):
+        return f + self.atol + self.rtol * np.abs(f)
+
+    def covers(self, f) -> bool:
+        # the candidate with the smallest second objective among those with f_j0 <= upper_0 is the last one
+        upper = self._upper(f)
+        i = np.searchsorted(self.f[:, 0], upper[0], side='right') - 1
+        return i >= 0 and self.f[i, 1] <= upper[1]
+
+    def add(self, f, key) -> bool:
+        if self.covers(f):
+            return False
+        # f dominates every j with f <= upper_j; upper_j0 increases and upper_j1 decreases with j
+        lo = np.searchsorted(self._upper(self.f[:, 0]), f[0], side='left')
+        hi = len(self.f) - np.searchsorted(self._upper(self.f[::-1, 1]), f[1], side='left')
+        hi = max(lo, hi)
+        self.f = np.concatenate([self.f[:lo], f[None, :], self.f[hi:]])
+        self.keys[lo:hi] = [key]
+        return True
+
+    def points(self):
+        return self.f.copy(), list(self.keys)
+
+
+class _Node:
+    __slots__ = ('ideal', 'nadir', 'rows', 'children')
+
+    def __init__(self, ideal, nadir, rows=None):
+        self.ideal = ideal
+        self.nadir = nadir
+        self.rows = rows  # row indices in the store for leaves, None for internal nodes
+        self.children = []
+
+
+class _NDTree:
+    """Non-dominated set of three or more objectives, indexed by an ND-tree (Jaszkiewicz and Lust, 2018).
+
+    Every node keeps the ideal and nadir points of the points below it, so whole subtrees are skipped when they cannot
+    hold a point that dominates, or is dominated by, a new point. The points themselves live in one contiguous array,
+    and leaves refer to them by row.
+    """
+
+    def __init__(self, p: int, rtol: float, atol: float, leaf_size: int):
+        self.p = p
+        self.rtol = rtol
+        self.atol = atol
+        self.leaf_size = leaf_size
+        self.store = np.empty((16, p))
+        self.store_keys = [None] * 16
+        self.free = list(range(15, -1, -1))
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _upper(self, f):
+        return f + self.atol + self.rtol * np.abs(f)
+
+    def covers(self, f) -> bool:
+        upper = self._upper(f)
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if (node.nadir <= upper).all():
+                return True  # every point below the node is at least as good as f
+            if not (node.ideal <= upper).all():
+                continue
+            if node.rows is None:
+                stack.extend(node.children)
+            elif (self.store[node.rows] <= upper).all(axis=1).any():
+                return True
+        return False
+
+    def _remove_dominated(self, node, f) -> bool:
+        """Remove the points below ``node`` dominated by ``f``; return whether the node became empty."""
+        if (f <= self._upper(node.ideal)).all():
+            self._release(node)
+            return True
+        if not (f <= self._upper(node.nadir)).all():
+            return False
+        if node.rows is None:
+            node.children = [child for child in node.children if not self._remove_dominated(child, f)]
+            return not node.children
+        dominated = (f <= self._upper(self.store[node.rows])).all(axis=1)
+        if dominated.any():
+            self._free(node.rows[dominated])
+            node.rows = node.rows[~dominated]
+        return len(node.rows) == 0
+
+    def _release(self, node):
+        if node.rows is None:
+            for child in node.children:
+                self._release(child)
+        else:
+            self._free(node.rows)
+
+    def _free(self, rows):
+        for row in rows:
+            self.store_keys[row] = None
+        self.free.extend(rows.tolist())
+        self.size -= len(rows)
+
+    def _allocate(self, f, key) -> int:
+        if not self.free:
+            capacity = len(self.store)
+            self.store = np.concatenate([self.store, np.empty((capacity, self.p))])
+            self.store_keys.extend([None] * capacity)
+            self.free = list(range(2 * capacity - 1, capacity - 1, -1))
+        row = self.free.pop()
+        self.store[row] = f
+        self.store_keys[row] = key
+        self.size += 1
+        return row
+
+    def add(self, f, key) -> bool:
+        if self.covers(f):
+            return False
+        if self.root is not None and self._remove_dominated(self.root, f):
+            self.root = None
+        row = self._allocate(f, key)
+        if self.root is None:
+            self.root = _Node(f.copy(), f.copy(), np.array([row]))
+            return True
+        node = self.root
+        while True:
+            np.minimum(node.ideal, f, out=node.ideal)
+            np.maximum(node.nadir, f, out=node.nadir)
+            if node.rows is not None:
+                break
+            # descend into the child whose box middle is closest to f
+            node = min(node.children, key=lambda child: np.square((child.ideal + child.nadir) / 2 - f).sum())
+        node.rows = np.append(node.rows, row)
+        if len(node.rows) > self.leaf_size:
+            self._split(node)
+        return True
+
+    def _split(self, node):
+        f = self.store[node.rows]
+        # seeds: the point farthest from the centroid, then repeatedly the point farthest from the chosen seeds
+        distance = np.square(f - f.mean(axis=0)).sum(axis=1)
+        seeds = []
+        for _ in range(min(self.p + 1, len(f))):
+            seed = int(np.argmax(distance))
+            seeds.append(seed)
+            distance = np.minimum(distance, np.square(f - f[seed]).sum(axis=1))
+            distance[seeds] = -1
+        nearest = np.argmin(np.square(f[:, None, :] - f[None, seeds, :]).sum(axis=2), axis=1)
+        for s in range(len(seeds)):
+            member = nearest == s
+            if member.any():
+                node.children.append(_Node(f[member].min(axis=0), f[member].max(axis=0), node.rows[member]))
+        node.rows = None
+
+    def points(self):
+        rows = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if node.rows is None:
+                stack.extend(node.children)
+            else:
+                rows.extend(node.rows.tolist())
+        rows.sort()
+        return self.store[rows].copy(), [self.store_keys[row] for row in rows]
+
+
+def _hypervolume(f, reference) -> float:
+    # points are minimized and strictly better than the reference in every objective
+    if len(f) == 0:
+        return 0.0
+    if f.shape[1] == 1:
+        return float(reference[0] - f[:, 0].min())
+    if f.shape[1] == 2:
+        f = f[np.argsort(f[:, 0], kind='stable')]
+        best = np.minimum.accumulate(f[:, 1])
+        heights = np.concatenate([[reference[1]], best[:-1]]) - best
+        return float(((reference[0] - f[:, 0]) * np.maximum(heights, 0)).sum())
+    # slice along the last objective: between two consecutive values, the volume is the hypervolume of the points
+    # already swept in the remaining objectives
+    f = f[np.argsort(f[:, -1], kind='stable')]
+    bounds = np.append(f[1:, -1], reference[-1])
+    volume = 0.0
+    for i in range(len(f)):
+        if bounds[i] > f[i, -1]:
+            volume += (bounds[i] - f[i, -1]) * _hypervolume(f[:i + 1, :-1], reference[:-1])
+    return volume
+
+
+class ParetoArchive:
+    """Incremental non-dominated set of objective vectors (minimized, unless ``maximize``).
+
+    Two values are considered equal when they are close in the sense of ``np.isclose(f_j, f_i, rtol, atol)``, as in
+    :func:`pareto_filter`. :meth:`add` rejects a point dominated by or equal to one already
+    in the archive, and removes the points the new one dominates. Each point may carry a ``key``, such as the grid index
+    of the solve that found it. Bi-objective archives are kept sorted, larger ones in an ND-tree, so a dominance test
+    does not compare the new point with the whole archive.
+    """
+
+    def __init__(self, p: int, rtol: float = 1e-05, atol: float = 1e-08, maximize: bool = False,
+                 leaf_size: int = 16):
+        self.p = p
+        self.sign = -1.0 if maximize else 1.0
+        self._front = _SortedFront(rtol, atol) if p == 2 else _NDTree(p, rtol, atol, leaf_size)
+
+    def __len__(self):
+        return len(self._front)
+
+    def _point(self, point):
+        f = self.sign * np.asarray(point, dtype=float).reshape(-1)
+        if len(f) != self.p:
+            raise ValueError(f'expected {self.p} objectives, got {len(f)}')
+        return f
+
+    def covers(self, point) -> bool:
+        """Whether ``point`` is dominated by or equal to a point in the archive."""
+        return len(self) > 0 and bool(self._front.covers(self._point(point)))
+
+    def add(self, point, key: Hashable = None) -> bool:
+        """Insert ``point`` unless the archive covers it; return whether it was inserted."""
+        return bool(self._front.add(self._point(point), key))
+
+    def update(self, points, keys: Iterable[Hashable] = None) -> np.ndarray:
+        """Insert the rows of ``points``; return a boolean mask of the rows that were inserted.
+
+        The rows dominated within the batch are discarded before they reach the archive.
+        """
+        f = self.sign * np.asarray(points, dtype=float).reshape(-1, self.p)
+        keys = [None] * len(f) if keys is None else list(keys)
+        inserted = np.zeros(len(f), dtype=bool)
+        for i in pareto_filter(f, self._front.rtol, self._front.atol):
+            inserted[i] = self._front.add(f[i], keys[i])
+        return inserted
+
+    @property
+    def points(self) -> np.ndarray:
+        return self.sign * self._front.points()[0]
+
+    @property
+    def keys(self) -> List[Hashable]:
+        """Keys of :attr:`points`, in the same order."""
+        return self._front.points()[1]
+
+    def hypervolume(self, reference) -> float:
+        """Volume of the objective space dominated by the archive and bounded by ``reference``."""
+        reference = self._point(reference)
+        f = self.sign * self.points
+        return _hypervolume(f[(f < reference).all(axis=1)], reference)
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+from industrialucn.pareto import ParetoArchive, pareto_filter
+
+
+def sorted_rows(points):
+    points = np.asarray(points)
+    return points[np.lexsort(points.T[::-1])]
+
+
+class ParetoArchiveTest(unittest.TestCase):
+
+    def test_add(self):
+        archive = ParetoArchive(3)
+        self.assertTrue(archive.add([2.0, 2757.5, 116.1], key=(0, 0)))
+        self.assertFalse(archive.add([2.0, 2757.5, 116.1], key=(0, 1)))  # duplicate
+        self.assertFalse(archive.add([2.0, 2757.5 + 1e-9, 116.1]))  # duplicate within tolerance
+        self.assertFalse(archive.add([3.0, 2757.5, 116.1]))  # dominated
+        self.assertTrue(archive.add([13.0, 1351.1, 56.9], key=(1, 0)))
+        self.assertTrue(archive.covers([13.0, 1400.0, 56.9]))
+        self.assertFalse(archive.covers([1.0, 3000.0, 200.0]))
+        self.assertTrue(archive.add([2.0, 2700.0, 116.1], key=(2, 0)))  # dominates the first point
+        self.assertEqual(len(archive), 2)
+        self.assertListEqual(sorted(archive.keys), [(1, 0), (2, 0)])
+        with self.assertRaises(ValueError):
+            archive.add([1.0, 2.0])
+
+    def test_random(self):
+        rnd_state = np.random.RandomState(2)
+        for p in (2, 3, 4):
+            points = np.round(rnd_state.rand(2000, p) * 10, 1)
+            expected = sorted_rows(np.unique(points[pareto_filter(points)], axis=0))
+            archive = ParetoArchive(p, leaf_size=4)
+            for point in points:
+                archive.add(point)
+            np.testing.assert_array_equal(sorted_rows(archive.points), expected)
+            bulk = ParetoArchive(p)
+            inserted = bulk.update(points[:1000], keys=range(1000))
+            bulk.update(points[1000:], keys=range(1000, 2000))
+            np.testing.assert_array_equal(sorted_rows(bulk.points), expected)
+            self.assertTrue(all(inserted[key] for key in bulk.keys if key < 1000))
+            for i, key in enumerate(bulk.keys):
+                np.testing.assert_array_equal(points[key], bulk.points[i])
+
+    def test_maximize(self):
+        rnd_state = np.random.RandomState(3)
+        points = np.round(rnd_state.rand(500, 3) * 10, 1)
+        archive = ParetoArchive(3, maximize=True)
+        archive.update(points)
+        expected = sorted_rows(np.unique(points[pareto_filter(-points)], axis=0))
+        np.testing.assert_array_equal(sorted_rows(archive.points), expected)
+        negated = ParetoArchive(3)
+        negated.update(-points)
+        self.assertGreater(archive.hypervolume([0, 0, 0]), 0)
+        self.assertAlmostEqual(archive.hypervolume([0, 0, 0]), negated.hypervolume([0, 0, 0]))
+
+    def test_hypervolume(self):
+        archive = ParetoArchive(2)
+        archive.update([[1, 3], [2, 2], [3, 1], [3, 3]])
+        self.assertAlmostEqual(archive.hypervolume([4, 4]), 3 + 2 + 1)
+        self.assertAlmostEqual(archive.hypervolume([2.5, 4]), 1.5 * 1 + 0.5 * 1)
+        # Monte Carlo estimate in three and four dimensions
+        rnd_state = np.random.RandomState(4)
+        for p in (3, 4):
+            archive = ParetoArchive(p)
+            archive.update(rnd_state.rand(50, p))
+            samples = rnd_state.rand(200_000, p)
+            points = archive.points
+            covered = np.zeros(len(samples), dtype=bool)
+            for point in points:
+                covered |= (samples >= point).all(axis=1)
+            self.assertAlmostEqual(archive.hypervolume(np.ones(p)), covered.mean(), places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
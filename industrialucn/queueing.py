@@ -1,7 +1,218 @@
+import functools
+import math
+from collections import namedtuple
+
 import numpy as np
 
+# Every function broadcasts over its arguments: scalars give scalars, arrays give arrays of the broadcast shape.
+# Normalization constants are computed with the Erlang B recursion or with rescaled birth-death recursions, so
+# server counts and capacities in the thousands neither overflow nor need big integers.
+Metrics = namedtuple('Metrics', 'rho po nqueue nsis tqueue tsis')
+FiniteCapacityMetrics = namedtuple('FiniteCapacityMetrics', 'rho po pk lambda_ef nqueue nsis tqueue tsis')
+FiniteSourceMetrics = namedtuple('FiniteSourceMetrics', 'rho po lambda_ef nqueue nsis tqueue tsis')
+Probability = namedtuple('Probability', 'po pj')
+
+
+class Distribution(namedtuple('Distribution', 'pj cdf')):
+    """Probabilities ``P_j`` of the number in the system, ``j = 0, 1, ...`` along the last axis, and their CDF."""
+
+    def quantile(self, q):
+        """Smallest ``j`` with ``P(N <= j) >= q``; ``len(pj)`` when a truncated distribution does not reach ``q``."""
+        return np.sum(self.cdf < np.expand_dims(q, -1), axis=-1)[()]
+
+
+def _result(cls, *values):
+    # 0-d arrays are returned as scalars
+    return cls(*(np.asarray(value)[()] for value in values))
+
+
+def _asarrays(arrival, departure, *sizes):
+    # lists are converted up front: s * departure would repeat a list, and j > s does not compare lists
+    return (np.asarray(arrival, dtype=float), np.asarray(departure, dtype=float)) + tuple(map(np.asarray, sizes))
+
+
+def _lgamma(x):
+    # math.lgamma of the distinct values only; server counts and capacities repeat a lot across a broadcast
+    x = np.asarray(x)
+    values, inverse = np.unique(x.ravel(), return_inverse=True)
+    return np.array([math.lgamma(value) for value in values.tolist()], dtype=float)[inverse].reshape(x.shape)
+
+
+def _log_poisson_term(a, i):
+    """Return ``log(a ** i / i!)``."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(np.asarray(i) == 0, 0.0, i * np.log(a)) - _lgamma(np.asarray(i) + 1)
+
+
+def _log_inverse_erlang_b(a, s):
+    """Return ``log(1 / B)``, ``B`` being the Erlang B blocking probability of ``s`` servers with load ``a``."""
+    a, s = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(s))
+    b = np.ones(a.shape)
+    for i in range(1, int(s.max(initial=0)) + 1):
+        b = np.where(i <= s, a * b / (i + a * b), b)
+    log_inverse = np.zeros(a.shape)
+    with np.errstate(divide='ignore'):
+        log_inverse -= np.log(b)
+    # B underflows for many servers and a light load; there 1 / B(i) = 1 + i / a / B(i - 1) is run in log space
+    tiny = b < 1e-300
+    if tiny.any():
+        a, s = a[tiny], s[tiny]
+        log_tiny = np.zeros(a.shape)
+        for i in range(1, int(s.max()) + 1):
+            log_tiny = np.where(i <= s, np.logaddexp(0, np.log(i / a) + log_tiny), log_tiny)
+        log_inverse[tiny] = log_tiny
+    return log_inverse
+
+
+def _log_normalization(a, s):
+    """Return ``log(sum(a ** i / i! for i < s) + a ** s / (s! * (1 - rho)))``, relative to ``a ** s / s!``."""
+    rho = a / s
+    log_inverse = _log_inverse_erlang_b(a, s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 1 / B - 1 = sum(a ** i / i! for i < s) / (a ** s / s!)
+        log_partial = log_inverse + np.log1p(-np.exp(-log_inverse))
+        return np.logaddexp(log_partial, -np.log(1 - rho))
+
+
+def erlang_b(arrival, departure, s):
+    """Blocking probability of an M/M/s/s queue, by the recursion ``B(i) = a * B(i - 1) / (i + a * B(i - 1))``.
+
+    The recursion runs in O(s), involves no factorial and is stable for any number of servers.
+    """
+    arrival, departure, s = _asarrays(arrival, departure, s)
+    return np.exp(-_log_inverse_erlang_b(arrival / departure, s))[()]
+
+
+def erlang_c(arrival, departure, s):
+    """Probability of waiting in an M/M/s queue; 1 when the queue is unstable (``s <= arrival / departure``)."""
+    arrival, departure, s = _asarrays(arrival, departure, s)
+    a = arrival / departure
+    b = erlang_b(arrival, departure, s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(s > a, s * b / (s - a * (1 - b)), 1.0)[()]
+
+
+def _birth_death(a, s, k, n=None):
+    """Normalize the birth-death chain ``w_0 = 1``, ``w_i = w_(i - 1) * a / min(i, s)`` for ``i <= k``.
+
+    With ``n`` sources the birth rate is proportional to the idle sources, ``w_i = w_(i - 1) * a * (n - i + 1) /
+    min(i, s)``. Return ``log(sum(w_i))``, the mean number in the system and in the queue, and ``log(w_k)``. The
+    weights are rescaled whenever they grow large, so that nothing overflows however long the chain.
+    """
+    finite = n is not None
+    a, s, k, n = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(s), np.asarray(k),
+                                     np.asarray(n if finite else 0))
+    w = np.ones(a.shape)
+    total = np.ones(a.shape)
+    nsis = np.zeros(a.shape)
+    nqueue = np.zeros(a.shape)
+    scale = np.zeros(a.shape)  # log of the factor the accumulators have been divided by
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(1, int(k.max(initial=0)) + 1):
+            active = i <= k
+            ratio = a / np.minimum(i, s)
+            if finite:
+                ratio = ratio * (n - i + 1)
+            w = np.where(active, w * ratio, w)
+            contribution = np.where(active, w, 0)
+            total += contribution
+            nsis += i * contribution
+            nqueue += np.maximum(i - s, 0) * contribution
+            large = w > 1e150
+            if large.any():
+                factor = np.where(large, w, 1.0)
+                w = w / factor
+                total /= factor
+                nsis /= factor
+                nqueue /= factor
+                scale += np.log(factor)
+        return np.log(total) + scale, nsis / total, nqueue / total, np.log(w) + scale
+
+
+def _log_weight(a, s, j, k, n=None):
+    """Return ``log(w_j)`` of the chain of :func:`_birth_death` in closed form, ``-inf`` past ``k``."""
+    m = np.minimum(j, s)
+    log_w = _log_poisson_term(a, m)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_w = log_w + np.where(j > s, (j - m) * np.log(a / s), 0.0)
+        if n is not None:
+            log_w = log_w + _lgamma(np.asarray(n) + 1) - _lgamma(np.maximum(np.asarray(n) - j, 0) + 1)
+    return np.where((0 <= j) & (j <= k), log_w, -np.inf)
+
+
+def _mms_normalization(a, s):
+    return _log_normalization(a, s), _log_poisson_term(a, s)
+
+
+_normalizations = {'mms': _mms_normalization, 'chain': _birth_death}
+_cache = None
+
+
+def enable_cache(maxsize: int = 4096):
+    """Keep the normalization constants of the last ``maxsize`` scalar parameter tuples.
+
+    The metric and ``*prob`` functions of a model then share the normalization of their parameters, so repeated
+    queries cost O(1) after the first. The cache is a thread-safe ``functools.lru_cache``; arrays of parameters are
+    always computed afresh.
+    """
+    global _cache
+
+    def normalization(kind, *parameters):
+        return tuple(np.asarray(value)[()] for value in _normalizations[kind](*parameters))
+
+    _cache = functools.lru_cache(maxsize=maxsize)(normalization)
+
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+
+def cache_info():
+    """Hits, misses, maxsize and current size of the cache, or None when it is disabled."""
+    cache = _cache
+    return None if cache is None else cache.cache_info()
+
+
+def _normalization(kind, *parameters):
+    cache = _cache
+    if cache is not None and all(np.ndim(parameter) == 0 for parameter in parameters):
+        # key on the load and the integer sizes, whatever the types and the arrival and departure rates they come from
+        return cache(kind, *(None if parameter is None else np.asarray(parameter).item() for parameter in parameters))
+    return _normalizations[kind](*parameters)
+
+
+def _log_ratios(a, s, k, n=None):
+    # log(w_i / w_(i - 1)) for i = 1, ..., max(k) along a new last axis, -inf past k; see _birth_death
+    finite = n is not None
+    a, s, k, n = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(s), np.asarray(k),
+                                     np.asarray(n if finite else 0))
+    i = np.arange(1, int(k.max(initial=0)) + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratio = np.log(a)[..., None] - np.log(np.minimum(i, s[..., None]))
+        if finite:
+            log_ratio = log_ratio + np.log(n[..., None] - i + 1)
+    return np.where(i <= k[..., None], log_ratio, -np.inf)
+
+
+def _distribution(log_ratio, log_po=None):
+    """Normalize the weights ``w_0 = 1``, ``w_i = w_(i - 1) * exp(log_ratio[..., i - 1])`` in one pass.
+
+    The weights are accumulated as logarithms and normalized by log-sum-exp, or by ``log_po`` when the distribution is
+    a truncation of an infinite one.
+    """
+    log_w = np.concatenate([np.zeros(log_ratio.shape[:-1] + (1,)), np.cumsum(log_ratio, axis=-1)], axis=-1)
+    if log_po is None:
+        top = log_w.max(axis=-1, keepdims=True)
+        log_z = top + np.log(np.exp(log_w - top).sum(axis=-1, keepdims=True))
+    else:
+        log_z = -np.asarray(log_po)[..., None]
+    pj = np.exp(log_w - log_z)
+    return Distribution(pj, np.cumsum(pj, axis=-1))
+
 
 def mm1(arrival, departure):
+    arrival, departure = _asarrays(arrival, departure)
     rho = arrival / departure
     po = 1 - rho
     nqueue = rho ** 2 / (1 - rho)
@@ -9,46 +220,47 @@ def mm1(arrival, departure):
     tqueue = nqueue / arrival
     tsis = nsis / arrival
 
-    return rho, po, nqueue, nsis, tqueue, tsis
+    return _result(Metrics, rho, po, nqueue, nsis, tqueue, tsis)
 
 
 def mm1prob(arrival, departure, j):
+    arrival, departure, j = _asarrays(arrival, departure, j)
     rho = arrival / departure
     po = 1 - rho
     pj = rho ** j * po
 
-    return po, pj
+    return _result(Probability, po, pj)
 
 
 def mms(arrival, departure, s):
-    rho = arrival / (s * departure)
+    arrival, departure, s = _asarrays(arrival, departure, s)
+    a = arrival / departure
+    rho = a / s
 
-    po = 1 / (sum(1 / np.math.factorial(i) * (arrival / departure) ** i for i in range(s)) + (
-            arrival / departure) ** s / (np.math.factorial(s) * (1 - rho)))
+    log_d, log_ws = _normalization('mms', a, s)
+    po = np.exp(-log_ws - log_d)
 
-    nqueue = po * (arrival / departure) ** s * rho / (np.math.factorial(s) * (1 - rho) ** 2)
-    nsis = nqueue + arrival / departure
+    nqueue = rho / (1 - rho) ** 2 * np.exp(-log_d)
+    nsis = nqueue + a
     tqueue = nqueue / arrival
     tsis = nsis / arrival
 
-    return rho, po, nqueue, nsis, tqueue, tsis
+    return _result(Metrics, rho, po, nqueue, nsis, tqueue, tsis)
 
 
 def mmsprob(arrival, departure, s, j):
-    rho = arrival / (s * departure)
+    arrival, departure, s, j = _asarrays(arrival, departure, s, j)
+    a = arrival / departure
 
-    po = 1 / (sum(1 / np.math.factorial(i) * (arrival / departure) ** i for i in range(s)) + (
-            arrival / departure) ** s / (np.math.factorial(s) * (1 - rho)))
+    log_d, log_ws = _normalization('mms', a, s)
+    po = np.exp(-log_ws - log_d)
+    pj = np.exp(_log_weight(a, s, j, np.inf) - log_ws - log_d)
 
-    if j <= s:
-        pj = po * (arrival / departure) ** j / (np.math.factorial(j))
-    else:
-        pj = po * s ** s * (arrival / (s * departure)) ** j / (np.math.factorial(s))
-
-    return po, pj
+    return _result(Probability, po, pj)
 
 
 def mm1k(arrival, departure, k):
+    arrival, departure, k = _asarrays(arrival, departure, k)
     rho = arrival / departure
 
     po = (1 - rho) / (1 - rho ** (k + 1))
@@ -60,112 +272,192 @@ def mm1k(arrival, departure, k):
     tqueue = nqueue / lambda_ef
     tsis = nsis / lambda_ef
 
-    return rho, po, pk, lambda_ef, nqueue, nsis, tqueue, tsis
+    return _result(FiniteCapacityMetrics, rho, po, pk, lambda_ef, nqueue, nsis, tqueue, tsis)
 
 
 def mm1kprob(arrival, departure, k, j):
+    arrival, departure, k, j = _asarrays(arrival, departure, k, j)
     rho = arrival / departure
 
     po = (1 - rho) / (1 - rho ** (k + 1))
     pj = rho ** j * po
 
-    return po, pj
+    return _result(Probability, po, pj)
 
 
 def mmsk(arrival, departure, s, k):
+    arrival, departure, s, k = _asarrays(arrival, departure, s, k)
     rho = arrival / (s * departure)
 
-    po = 1 / (sum(1 / np.math.factorial(i) * (arrival / departure) ** i for i in range(s)) + (
-            arrival / departure) ** s / (np.math.factorial(s)) * (1 - rho ** (k - s + 1)) / (1 - rho))
-
-    if k <= s:
-        pk = po * (arrival / departure) ** k / (np.math.factorial(k))
-    else:
-        pk = po * s ** s * (arrival / (s * departure)) ** k / (np.math.factorial(s))
+    log_z, _, nqueue, log_wk = _normalization('chain', arrival / departure, s, k)
+    po = np.exp(-log_z)
+    pk = np.exp(log_wk - log_z)
 
     lambda_ef = arrival * (1 - pk)
 
-    nqueue = po * (arrival / departure) ** s * rho / (np.math.factorial(s) * (1 - rho) ** 2) * (
-            1 - rho ** (k - s) - (k - s) * rho ** (k - s) * (1 - rho))
     nsis = nqueue + lambda_ef / departure
     tqueue = nqueue / lambda_ef
     tsis = nsis / lambda_ef
 
-    return rho, po, pk, lambda_ef, nqueue, nsis, tqueue, tsis
+    return _result(FiniteCapacityMetrics, rho, po, pk, lambda_ef, nqueue, nsis, tqueue, tsis)
 
 
 def mmskprob(arrival, departure, s, k, j):
-    rho = arrival / (s * departure)
+    arrival, departure, s, k, j = _asarrays(arrival, departure, s, k, j)
+    a = arrival / departure
 
-    po = 1 / (sum(1 / np.math.factorial(i) * (arrival / departure) ** i for i in range(s)) + (
-            arrival / departure) ** s / (np.math.factorial(s)) * (1 - rho ** (k - s + 1)) / (1 - rho))
+    log_z, _, _, _ = _normalization('chain', a, s, k)
+    po = np.exp(-log_z)
+    pj = np.exp(_log_weight(a, s, j, k) - log_z)
 
-    if j <= s:
-        pj = po * (arrival / departure) ** j / (np.math.factorial(j))
-    else:
-        pj = po * s ** s * (arrival / (s * departure)) ** j / (np.math.factorial(s))
-
-    return po, pj
+    return _result(Probability, po, pj)
 
 
 def mm1n(arrival, departure, n):
+    arrival, departure, n = _asarrays(arrival, departure, n)
     rho = arrival / departure
-    po = 1 / (
-        sum(np.math.factorial(n) / np.math.factorial(n - i) * (arrival / (departure * n)) ** i for i in range(n + 1)))
 
-    nsis = sum(i * np.math.factorial(n) / np.math.factorial(n - i) * (arrival / (departure * n)) ** i * po for i in
-               range(n + 1))
+    log_z, nsis, _, _ = _normalization('chain', arrival / (departure * n), 1, n, n)
+    po = np.exp(-log_z)
+
     nqueue = nsis - arrival * (1 - po) / departure
 
     lambda_ef = arrival * (n - nsis)
     tqueue = nqueue / lambda_ef
     tsis = nsis / lambda_ef
 
-    return rho, po, lambda_ef, nqueue, nsis, tqueue, tsis
+    return _result(FiniteSourceMetrics, rho, po, lambda_ef, nqueue, nsis, tqueue, tsis)
 
 
 def mm1nprob(arrival, departure, n, j):
-    po = 1 / (
-        sum(np.math.factorial(n) / np.math.factorial(n - i) * (arrival / (departure * n)) ** i for i in range(n + 1)))
+    arrival, departure, n, j = _asarrays(arrival, departure, n, j)
+    r = arrival / (departure * n)
 
-    pj = np.math.factorial(n) / np.math.factorial(n - j) * (arrival / (departure * n)) ** j * po
+    log_z, _, _, _ = _normalization('chain', r, 1, n, n)
+    po = np.exp(-log_z)
 
-    return po, pj
+    pj = np.exp(_log_weight(r, 1, j, n, n) - log_z)
+
+    return _result(Probability, po, pj)
 
 
 def mmsn(arrival, departure, s, n):
+    arrival, departure, s, n = _asarrays(arrival, departure, s, n)
     rho = arrival / (s * departure)
-    po = 1 / (sum(
-        np.math.factorial(n) / (np.math.factorial(n - i) * np.math.factorial(i)) * (arrival / (departure * n)) ** i for
-        i in range(0, s)) + s ** s / np.math.factorial(s) * sum(
-        np.math.factorial(n) / np.math.factorial(n - i) * (arrival / (s * departure * n)) ** i for i in
-        range(s, n + 1)))
 
-    nsis = po * (arrival / departure * (1 + (arrival / (departure * n))) ** (n - 1) + sum(
-        np.math.factorial(n) / np.math.factorial(n - j) * j * (
-                s ** s / np.math.factorial(s) - s ** j / np.math.factorial(j)) * (arrival / (s * departure * n)) ** j
-        for j in range(s, n + 1)))
+    log_z, nsis, nqueue, _ = _normalization('chain', arrival / (departure * n), s, n, n)
+    po = np.exp(-log_z)
 
     lambda_ef = arrival * (1 - nsis / n)
-    nqueue = nsis - (arrival / departure) * (lambda_ef / arrival)
     tqueue = nqueue / lambda_ef
     tsis = nsis / lambda_ef
 
-    return rho, po, lambda_ef, nqueue, nsis, tqueue, tsis
+    return _result(FiniteSourceMetrics, rho, po, lambda_ef, nqueue, nsis, tqueue, tsis)
 
 
 def mmsnprob(arrival, departure, s, n, j):
-    po = 1 / (sum(
-        np.math.factorial(n) / (np.math.factorial(n - i) * np.math.factorial(i)) * (arrival / (departure * n)) ** i for
-        i in range(0, s)) + s ** s / np.math.factorial(s) * sum(
-        np.math.factorial(n) / np.math.factorial(n - i) * (arrival / (s * departure * n)) ** i for i in
-        range(s, n + 1)))
-
-    if j <= s:
-        pj = np.math.factorial(n) / (np.math.factorial(n - j) * np.math.factorial(j)) * (
-                arrival / (departure * n)) ** j * po
-    else:
-        pj = np.math.factorial(n) / (np.math.factorial(n - j)) * (s ** s / np.math.factorial(s)) * (
-                arrival / (s * departure * n)) ** j * po
+    arrival, departure, s, n, j = _asarrays(arrival, departure, s, n, j)
+    r = arrival / (departure * n)
 
-    return po, pj
+    log_z, _, _, _ = _normalization('chain', r, s, n, n)
+    po = np.exp(-log_z)
+
+    pj = np.exp(_log_weight(r, s, j, n, n) - log_z)
+
+    return _result(Probability, po, pj)
+
+
+def mm1_distribution(arrival, departure, jmax):
+    """Probabilities of 0, ..., ``jmax`` customers in an M/M/1 queue."""
+    arrival, departure, jmax = _asarrays(arrival, departure, jmax)
+    rho = arrival / departure
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _distribution(_log_ratios(rho, 1, jmax), np.log(1 - rho))
+
+
+def mms_distribution(arrival, departure, s, jmax):
+    """Probabilities of 0, ..., ``jmax`` customers in an M/M/s queue."""
+    arrival, departure, s, jmax = _asarrays(arrival, departure, s, jmax)
+    a = arrival / departure
+    return _distribution(_log_ratios(a, s, jmax), -_log_poisson_term(a, s) - _log_normalization(a, s))
+
+
+def mm1k_distribution(arrival, departure, k):
+    """Probabilities of 0, ..., ``k`` customers in an M/M/1/K queue."""
+    arrival, departure, k = _asarrays(arrival, departure, k)
+    return _distribution(_log_ratios(arrival / departure, 1, k))
+
+
+def mmsk_distribution(arrival, departure, s, k):
+    """Probabilities of 0, ..., ``k`` customers in an M/M/s/K queue."""
+    arrival, departure, s, k = _asarrays(arrival, departure, s, k)
+    return _distribution(_log_ratios(arrival / departure, s, k))
+
+
+def mm1n_distribution(arrival, departure, n):
+    """Probabilities of 0, ..., ``n`` customers in an M/M/1 queue with ``n`` sources."""
+    arrival, departure, n = _asarrays(arrival, departure, n)
+    return _distribution(_log_ratios(arrival / (departure * n), 1, n, n))
+
+
+def mmsn_distribution(arrival, departure, s, n):
+    """Probabilities of 0, ..., ``n`` customers in an M/M/s queue with ``n`` sources."""
+    arrival, departure, s, n = _asarrays(arrival, departure, s, n)
+    return _distribution(_log_ratios(arrival / (departure * n), s, n, n))
+
+
+_staffing_metrics = ('tqueue', 'nqueue', 'wait_probability', 'wait_tail', 'blocking')
+
+
+def _staffing_metric(metric, b, s, arrival, departure, t):
+    # metric of an M/M/s queue (M/M/s/s for blocking) from its Erlang B probability b; inf when unstable
+    if metric == 'blocking':
+        return b
+    a = arrival / departure
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = s * b / (s - a * (1 - b))  # Erlang C
+        if metric == 'wait_probability':
+            value = c
+        elif metric == 'wait_tail':
+            value = c * np.exp(-(s * departure - arrival) * t)
+        elif metric == 'nqueue':
+            value = c * a / (s - a)
+        else:
+            value = c / (s * departure - arrival)
+    return np.where(s > a, value, np.inf)
+
+
+def min_servers(arrival, departure, target, metric: str = 'tqueue', t=0.0):
+    """Smallest number of servers whose ``metric`` is at most ``target``, for every (arrival, departure) pair.
+
+    ``metric`` is one of "tqueue" (mean wait in an M/M/s queue), "nqueue" (mean queue length), "wait_probability"
+    (Erlang C), "wait_tail" (probability of waiting longer than ``t``) or "blocking" (Erlang B, M/M/s/s). Erlang B is
+    carried from s to s + 1 for all the pairs at once, and each pair leaves the batch as soon as it meets its target,
+    so a whole batch costs as many vector steps as its largest staffing level.
+    """
+    if metric not in _staffing_metrics:
+        raise NotImplementedError(f'{metric} is not a valid metric; must be one of {", ".join(_staffing_metrics)}')
+    arrival, departure, target, t = np.broadcast_arrays(np.asarray(arrival, dtype=float), np.asarray(departure),
+                                                        np.asarray(target), np.asarray(t))
+    shape = arrival.shape
+    arrival, departure, target, t = (np.ravel(x) for x in (arrival, departure, target, t))
+    if not all(np.isfinite(x).all() for x in (arrival, departure, target, t)):
+        raise ValueError('arrival, departure, target and t must be finite')
+    if (arrival < 0).any() or (departure <= 0).any():
+        raise ValueError('arrival must be non-negative and departure positive')
+    if (t < 0).any():
+        raise ValueError('t must be non-negative')
+    if (target <= 0).any():
+        raise ValueError('target must be positive')
+    servers = np.zeros(len(arrival), dtype=int)
+    active = np.arange(len(arrival))
+    a = arrival / departure
+    b = np.ones(len(arrival))
+    s = 0
+    while len(active):
+        s += 1
+        b = a[active] * b / (s + a[active] * b)
+        met = _staffing_metric(metric, b, s, arrival[active], departure[active], t[active]) <= target[active]
+        servers[active[met]] = s
+        active, b = active[~met], b[~met]
+    return servers.reshape(shape)[()]
@@ -0,0 +1,228 @@
+import itertools
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from math import factorial
+
+import numpy as np
+
+from industrialucn import queueing as q
+
+
+# scalar reference formulas, as in the original module
+
+def mms(arrival, departure, s):
+    rho = arrival / (s * departure)
+    po = 1 / (sum(1 / factorial(i) * (arrival / departure) ** i for i in range(s)) + (
+            arrival / departure) ** s / (factorial(s) * (1 - rho)))
+    nqueue = po * (arrival / departure) ** s * rho / (factorial(s) * (1 - rho) ** 2)
+    nsis = nqueue + arrival / departure
+    return rho, po, nqueue, nsis, nqueue / arrival, nsis / arrival
+
+
+def mmsprob(arrival, departure, s, j):
+    rho = arrival / (s * departure)
+    po = 1 / (sum(1 / factorial(i) * (arrival / departure) ** i for i in range(s)) + (
+            arrival / departure) ** s / (factorial(s) * (1 - rho)))
+    if j <= s:
+        return po, po * (arrival / departure) ** j / factorial(j)
+    return po, po * s ** s * (arrival / (s * departure)) ** j / factorial(s)
+
+
+def mmsk(arrival, departure, s, k):
+    rho = arrival / (s * departure)
+    po = 1 / (sum(1 / factorial(i) * (arrival / departure) ** i for i in range(s)) + (
+            arrival / departure) ** s / (factorial(s)) * (1 - rho ** (k - s + 1)) / (1 - rho))
+    if k <= s:
+        pk = po * (arrival / departure) ** k / (factorial(k))
+    else:
+        pk = po * s ** s * (arrival / (s * departure)) ** k / (factorial(s))
+    lambda_ef = arrival * (1 - pk)
+    nqueue = po * (arrival / departure) ** s * rho / (factorial(s) * (1 - rho) ** 2) * (
+            1 - rho ** (k - s) - (k - s) * rho ** (k - s) * (1 - rho))
+    nsis = nqueue + lambda_ef / departure
+    return rho, po, pk, lambda_ef, nqueue, nsis, nqueue / lambda_ef, nsis / lambda_ef
+
+
+def mm1n(arrival, departure, n):
+    rho = arrival / departure
+    po = 1 / (sum(factorial(n) / factorial(n - i) * (arrival / (departure * n)) ** i for i in range(n + 1)))
+    nsis = sum(i * factorial(n) / factorial(n - i) * (arrival / (departure * n)) ** i * po for i in range(n + 1))
+    nqueue = nsis - arrival * (1 - po) / departure
+    lambda_ef = arrival * (n - nsis)
+    return rho, po, lambda_ef, nqueue, nsis, nqueue / lambda_ef, nsis / lambda_ef
+
+
+def mmsn(arrival, departure, s, n):
+    rho = arrival / (s * departure)
+    po = 1 / (sum(
+        factorial(n) / (factorial(n - i) * factorial(i)) * (arrival / (departure * n)) ** i for i in range(0, s)) +
+        s ** s / factorial(s) * sum(
+        factorial(n) / factorial(n - i) * (arrival / (s * departure * n)) ** i for i in range(s, n + 1)))
+    nsis = po * (arrival / departure * (1 + (arrival / (departure * n))) ** (n - 1) + sum(
+        factorial(n) / factorial(n - j) * j * (s ** s / factorial(s) - s ** j / factorial(j)) * (
+                arrival / (s * departure * n)) ** j for j in range(s, n + 1)))
+    lambda_ef = arrival * (1 - nsis / n)
+    nqueue = nsis - (arrival / departure) * (lambda_ef / arrival)
+    return rho, po, lambda_ef, nqueue, nsis, nqueue / lambda_ef, nsis / lambda_ef
+
+
+def mmsnprob(arrival, departure, s, n, j):
+    _, po, *_ = mmsn(arrival, departure, s, n)
+    if j <= s:
+        return po, factorial(n) / (factorial(n - j) * factorial(j)) * (arrival / (departure * n)) ** j * po
+    return po, factorial(n) / (factorial(n - j)) * (s ** s / factorial(s)) * (arrival / (s * departure * n)) ** j * po
+
+
+class Queueing(unittest.TestCase):
+
+    def assertVectorized(self, function, reference, *parameters):
+        grid = list(itertools.product(*parameters))
+        result = function(*(np.array(column) for column in zip(*grid)))
+        expected = np.array([reference(*point) for point in grid])
+        np.testing.assert_allclose(np.column_stack(result), expected, rtol=1e-9, atol=1e-12)
+        # plain lists broadcast like arrays
+        np.testing.assert_allclose(np.column_stack(function(*(list(column) for column in zip(*grid)))), expected,
+                                   rtol=1e-9, atol=1e-12)
+        for point, row in zip(grid, expected):
+            np.testing.assert_allclose(function(*point), row, rtol=1e-9, atol=1e-12)
+
+    def test_mm1(self):
+        rho, po, nqueue, nsis, tqueue, tsis = q.mm1(2, 3)
+        self.assertAlmostEqual(nqueue, 4 / 3)
+        self.assertAlmostEqual(tsis, 1)
+        result = q.mm1(np.array([1.0, 2.0]), 3)
+        np.testing.assert_allclose(result.po, [2 / 3, 1 / 3])
+        self.assertAlmostEqual(q.mm1prob(2, 3, 2).pj, 4 / 27)
+        np.testing.assert_allclose(q.mm1kprob(2, 3, 5, np.arange(6)).pj.sum(), 1)
+
+    def test_mms(self):
+        self.assertVectorized(q.mms, mms, [1.0, 4.5, 9.0], [2.0, 3.5], [5, 6, 12])
+        self.assertVectorized(q.mmsprob, mmsprob, [1.0, 4.5], [2.0, 3.5], [3, 6], [0, 2, 6, 9])
+
+    def test_mmsk(self):
+        self.assertVectorized(q.mmsk, mmsk, [1.0, 4.5, 9.0], [2.0, 3.5], [3, 6], [6, 10, 20])
+        result = q.mmsk(9.0, 2.0, 3, np.arange(3, 40))
+        self.assertEqual(result.pk.shape, (37,))
+
+    def test_mmsn(self):
+        self.assertVectorized(q.mm1n, mm1n, [0.5, 2.0], [1.0, 3.0], [1, 4, 10])
+        self.assertVectorized(q.mmsn, mmsn, [0.5, 2.0, 8.0], [1.0, 3.0], [1, 2, 4], [4, 10, 25])
+        self.assertVectorized(q.mmsnprob, mmsnprob, [0.5, 8.0], [1.0, 3.0], [1, 3], [4, 10], [0, 2, 4])
+        np.testing.assert_allclose(q.mmsnprob(8.0, 3.0, 3, 10, np.arange(11)).pj.sum(), 1)
+
+    def test_large_s(self):
+        # exact rational reference at s = 200, where a ** s / s! overflows a float
+        a, s = 190, 200
+        terms = [Fraction(a) ** i / factorial(i) for i in range(s + 1)]
+        ws = terms[-1] * Fraction(s, s - a)
+        po = 1 / (sum(terms[:-1]) + ws)
+        nqueue = po * terms[-1] * Fraction(a, s) / (1 - Fraction(a, s)) ** 2
+        result = q.mms(a, 1, s)
+        self.assertAlmostEqual(result.nqueue / float(nqueue), 1, places=10)
+        self.assertAlmostEqual(q.erlang_b(a, 1, s) / float(terms[-1] / sum(terms)), 1, places=10)
+        self.assertAlmostEqual(q.erlang_b(10, 1, 10), 0.2146, places=4)
+        # every arrival waits once the load reaches the number of servers
+        np.testing.assert_array_equal(q.erlang_c(10, 1, [5, 10]), [1, 1])
+        self.assertLess(q.erlang_c(10, 1, 11), 1)
+        # the Erlang B path for M/M/s and the rescaled chain for M/M/s/K agree with a negligible tail
+        for s in (1000, 10000):
+            arrival = np.array([0.05, 0.5, 0.9, 0.99]) * s
+            mms = q.mms(arrival, 1.0, s)
+            mmsk = q.mmsk(arrival, 1.0, s, s + 5000)
+            self.assertTrue(np.isfinite(mms.nqueue).all())
+            np.testing.assert_allclose(mmsk.nqueue, mms.nqueue, rtol=1e-8, atol=1e-12)
+            np.testing.assert_allclose(q.erlang_c(arrival, 1.0, s), mms.nqueue * (1 - arrival / s) / (arrival / s),
+                                       rtol=1e-8)
+            pj = q.mmsprob(arrival[:, None], 1.0, s, np.arange(s + 5000)).pj
+            np.testing.assert_allclose(pj.sum(axis=1), 1, rtol=1e-8)
+        # finite sources, more than ten thousand of them
+        result = q.mmsn(5000.0, 1.0, 100, 20000)
+        self.assertTrue(np.isfinite(result).all())
+        self.assertAlmostEqual(q.mmsnprob(5000.0, 1.0, 100, 20000, np.arange(20001)).pj.sum(), 1)
+
+    def test_distribution(self):
+        j = np.arange(31)
+        cases = [(q.mm1_distribution(1.5, 2.0, 30), q.mm1prob(1.5, 2.0, j)),
+                 (q.mms_distribution(4.5, 2.0, 3, 30), q.mmsprob(4.5, 2.0, 3, j)),
+                 (q.mm1k_distribution(2.5, 2.0, 30), q.mm1kprob(2.5, 2.0, 30, j)),
+                 (q.mmsk_distribution(9.0, 2.0, 3, 30), q.mmskprob(9.0, 2.0, 3, 30, j)),
+                 (q.mm1n_distribution(8.0, 3.0, 30), q.mm1nprob(8.0, 3.0, 30, j)),
+                 (q.mmsn_distribution(8.0, 3.0, 4, 30), q.mmsnprob(8.0, 3.0, 4, 30, j))]
+        for distribution, (po, pj) in cases:
+            np.testing.assert_allclose(distribution.pj, pj, rtol=1e-9, atol=1e-300)
+            np.testing.assert_allclose(distribution.cdf, np.cumsum(pj), rtol=1e-9)
+            self.assertEqual(distribution.quantile(0.5), np.searchsorted(np.cumsum(pj), 0.5))
+        # the finite models are complete, the infinite ones are truncations
+        self.assertAlmostEqual(cases[3][0].cdf[-1], 1)
+        self.assertLess(cases[1][0].cdf[-1], 1)
+        # broadcast over parameters, with the states along the last axis
+        distribution = q.mmsk_distribution(np.array([[2.0], [9.0]]), 2.0, [1, 3], [10, 20])
+        self.assertEqual(distribution.pj.shape, (2, 2, 21))
+        np.testing.assert_allclose(distribution.cdf[..., -1], 1)
+        np.testing.assert_allclose(distribution.pj[1, 1, :21], q.mmskprob(9.0, 2.0, 3, 20, np.arange(21)).pj)
+        self.assertTrue((distribution.pj[:, 0, 11:] == 0).all())
+        np.testing.assert_array_equal(distribution.quantile([[0.5], [0.99]]).shape, (2, 2))
+        # large capacities in one pass
+        distribution = q.mmsk_distribution(9500.0, 1.0, 10000, 30000)
+        self.assertAlmostEqual(distribution.cdf[-1], 1)
+        self.assertAlmostEqual((np.arange(30001) * distribution.pj).sum(), q.mmsk(9500.0, 1.0, 10000, 30000).nsis)
+
+    def test_min_servers(self):
+        arrival = np.array([0.5, 3.0, 12.0, 40.0, 95.0])
+        departure = 1.5
+        for metric, target, t in (('tqueue', 0.05, 0), ('nqueue', 0.2, 0), ('wait_probability', 0.1, 0),
+                                  ('wait_tail', 0.05, 0.2), ('blocking', 0.01, 0)):
+            servers = q.min_servers(arrival, departure, target, metric, t)
+            for lam, s in zip(arrival, servers):
+                def value(s):
+                    if metric == 'blocking':
+                        return q.erlang_b(lam, departure, s)
+                    if s <= lam / departure:
+                        return np.inf
+                    result = q.mms(lam, departure, s)
+                    return {'tqueue': result.tqueue, 'nqueue': result.nqueue,
+                            'wait_probability': q.erlang_c(lam, departure, s),
+                            'wait_tail': q.erlang_c(lam, departure, s) * np.exp(-(s * departure - lam) * t)}[metric]
+                self.assertLessEqual(value(s), target)
+                if s > 1:
+                    self.assertGreater(value(s - 1), target)
+        self.assertEqual(q.min_servers(10.0, 1.0, 0.01, 'blocking'), 18)
+        self.assertEqual(q.min_servers([[10.0], [20.0]], 1.0, [0.1, 0.01], 'blocking').shape, (2, 2))
+        with self.assertRaises(NotImplementedError):
+            q.min_servers(10.0, 1.0, 0.01, 'pk')
+        with self.assertRaises(ValueError):
+            q.min_servers(10.0, 1.0, 0)
+        for arrival, departure, target, t in [(10.0, 0.0, 0.1, 0.0), (np.nan, 1.0, 0.1, 0.0), (10.0, np.nan, 0.1, 0.0),
+                                              (10.0, 1.0, np.nan, 0.0), (10.0, 1.0, 0.1, np.nan),
+                                              (np.inf, 1.0, 0.1, 0.0), (-1.0, 1.0, 0.1, 0.0), (10.0, -1.0, 0.1, 0.0),
+                                              (5.0, 1.0, 0.5, -1.0)]:
+            with self.assertRaises(ValueError):
+                q.min_servers(arrival, departure, target, 'wait_tail', t)
+
+    def test_cache(self):
+        expected = q.mmsk(9.0, 2.0, 3, 12), q.mmskprob(9.0, 2.0, 3, 12, 5), q.mmsn(8.0, 3.0, 2, 10)
+        self.assertIsNone(q.cache_info())
+        q.enable_cache(maxsize=2)
+        try:
+            self.assertEqual(q.mmsk(9.0, 2.0, 3, 12), expected[0])
+            # the probabilities share the normalization of the metrics, also when it comes from equivalent rates
+            self.assertEqual(q.mmskprob(9, 2, 3, 12, 5), expected[1])
+            self.assertEqual(q.mmskprob(18.0, 4.0, 3, 12, 5).pj, expected[1].pj)
+            self.assertEqual(q.cache_info().hits, 2)
+            self.assertEqual(q.cache_info().misses, 1)
+            self.assertEqual(q.mmsn(8.0, 3.0, 2, 10), expected[2])
+            q.mms(9.0, 2.0, 5)
+            self.assertEqual(q.cache_info().currsize, 2)
+            np.testing.assert_array_equal(q.mmsk(np.array([9.0, 9.0]), 2.0, 3, 12).po, expected[0].po)
+            self.assertEqual(q.cache_info().misses, 3)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda i: q.mmskprob(9.0, 2.0, 3, 12 + i % 4, 5), range(200)))
+            self.assertEqual(results[::4], [expected[1]] * 50)
+        finally:
+            q.disable_cache()
+        self.assertIsNone(q.cache_info())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heapify, heappop, heappush, heapreplace
+from statistics import NormalDist
+
+import numpy as np
+
+try:
+    from scipy.stats import t as student_t
+except ImportError:
+    student_t = None
+
+# the metrics of a replication, named as in industrialucn.queueing
+SimulationMetrics = namedtuple('SimulationMetrics', 'po pk lambda_ef nqueue nsis tqueue tsis')
+ConfidenceInterval = namedtuple('ConfidenceInterval', 'mean half_width')
+
+
+class Variate:
+    """Picklable sampler of i.i.d. variates, drawn in batches from a ``numpy.random.Generator``.
+
+    ``Variate('gamma', 2.0, 0.5)`` draws ``rng.gamma(2.0, 0.5, size)``; ``Variate('constant', c)`` always returns
+    ``c``. Any callable ``f(rng, size)`` returning an array can be used in its place, as long as it can be pickled
+    when replications run in parallel.
+    """
+
+    def __init__(self, method: str, *args):
+        self.method = method
+        self.args = args
+
+    def __call__(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        if self.method == 'constant':
+            return np.full(size, float(self.args[0]))
+        return getattr(rng, self.method)(*self.args, size=size)
+
+    def __repr__(self):
+        return f'Variate({", ".join(map(repr, (self.method,) + self.args))})'
+
+
+def exponential(rate: float) -> Variate:
+    return Variate('exponential', 1 / rate)
+
+
+def _batches(variate, rng, batch: int):
+    while True:
+        yield from variate(rng, batch).tolist()
+
+
+def simulate(interarrival, service, s: int = 1, k: int = None, n: int = None, customers: int = 10 ** 6,
+             warmup: int = 0, seed=None, batch: int = 2 ** 16) -> SimulationMetrics:
+    """Simulate one replication of a G/G/s queue served first come, first served.
+
+    ``k`` bounds the number in the system (arrivals finding ``k`` customers are lost). With ``n`` the population is
+    finite: each of the ``n`` sources spends an ``interarrival`` time outside the system before coming back. The run
+    stops after ``customers`` arrivals; the first ``warmup`` arrivals are not measured. Time averages are obtained from
+    the waits and sojourns of the measured customers through Little's law.
+
+    Interarrival and service times are drawn ``batch`` at a time. Events are kept in binary heaps over flat lists: the
+    times at which each server becomes free, the departure times of the customers in the system (only with ``k``) and
+    the return times of the sources (only with ``n``).
+    """
+    if not 0 <= warmup < customers:
+        raise ValueError(f'warmup must be in [0, customers), got {warmup} with customers={customers}')
+    rng = np.random.default_rng(seed)
+    gaps = _batches(interarrival, rng, batch)
+    services = _batches(service, rng, batch)
+    free = [0.0] * s
+    in_system = []
+    returns = None
+    if n is not None:
+        returns = [next(gaps) for _ in range(n)]
+        heapify(returns)
+    t = t0 = 0.0
+    last_departure = 0.0
+    idle = waits = sojourns = 0.0
+    accepted = blocked = 0
+    for customer in range(customers):
+        if returns is None:
+            t += next(gaps)
+        else:
+            t = heappop(returns)
+        if customer == warmup:
+            t0 = t
+            idle = waits = sojourns = 0.0
+            accepted = blocked = 0
+        if k is not None:
+            while in_system and in_system[0] <= t:
+                heappop(in_system)
+            if len(in_system) >= k:
+                blocked += 1
+                if returns is not None:
+                    heappush(returns, t + next(gaps))
+                continue
+        if last_departure < t:
+            idle += t - last_departure
+        start = free[0] if free[0] > t else t
+        departure = start + next(services)
+        heapreplace(free, departure)
+        if k is not None:
+            heappush(in_system, departure)
+        if returns is not None:
+            heappush(returns, departure + next(gaps))
+        if departure > last_departure:
+            last_departure = departure
+        waits += start - t
+        sojourns += departure - t
+        accepted += 1
+    horizon = t - t0
+    return SimulationMetrics(po=idle / horizon,
+                             pk=blocked / (accepted + blocked),
+                             lambda_ef=accepted / horizon,
+                             nqueue=waits / horizon,
+                             nsis=sojourns / horizon,
+                             tqueue=waits / accepted,
+                             tsis=sojourns / accepted)
+
+
+def _simulate(args):
+    interarrival, service, s, k, n, customers, warmup, seed, batch = args
+    return simulate(interarrival, service, s, k, n, customers, warmup, seed, batch)
+
+
+def replicate(interarrival, service, s: int = 1, k: int = None, n: int = None, customers: int = 10 ** 6,
+              warmup: int = 0, replications: int = 10, workers: int = None, seed=None, confidence: float = 0.95,
+              batch: int = 2 ** 16) -> SimulationMetrics:
+    """Run independent replications of :func:`simulate` and return a confidence interval for every metric.
+
+    Each replication draws from its own stream, spawned from ``seed``. With ``workers`` > 1 the replications run in
+    separate processes, so ``interarrival`` and ``service`` must be picklable (see :class:`Variate`). The half widths
+    use Student's t quantile (the normal one when SciPy is not installed).
+    """
+    if replications < 2:
+        raise ValueError(f'at least two replications are needed for a confidence interval, got {replications}')
+    if not 0 <= warmup < customers:
+        raise ValueError(f'warmup must be in [0, customers), got {warmup} with customers={customers}')
+    seeds = np.random.SeedSequence(seed).spawn(replications)
+    tasks = [(interarrival, service, s, k, n, customers, warmup, child, batch) for child in seeds]
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(_simulate, tasks))
+    else:
+        results = [_simulate(task) for task in tasks]
+    values = np.array(results)
+    if student_t is not None:
+        quantile = student_t.ppf((1 + confidence) / 2, replications - 1)
+    else:
+        quantile = NormalDist().inv_cdf((1 + confidence) / 2)
+    half_widths = quantile * values.std(axis=0, ddof=1) / np.sqrt(replications)
+    return SimulationMetrics(*(ConfidenceInterval(float(mean), float(half_width))
+                               for mean, half_width in zip(values.mean(axis=0), half_widths)))
@@ -0,0 +1,44 @@
+import unittest
+
+from industrialucn import queueing as q
+from industrialucn import simulation as sim
+
+
+class Simulation(unittest.TestCase):
+
+    def assertWithin(self, estimate, expected):
+        for field in sim.SimulationMetrics._fields:
+            interval = getattr(estimate, field)
+            value = getattr(expected, field, 0.0)
+            self.assertLessEqual(abs(interval.mean - value), interval.half_width, field)
+
+    def test_mmsk(self):
+        estimate = sim.replicate(sim.exponential(5.0), sim.exponential(2.0), s=3, k=6, customers=100_000,
+                                 warmup=1000, replications=10, seed=1, confidence=0.99)
+        self.assertWithin(estimate, q.mmsk(5.0, 2.0, 3, 6))
+
+    def test_mmsn(self):
+        # each of the n sources arrives at rate arrival / n
+        estimate = sim.replicate(sim.exponential(8.0 / 10), sim.exponential(3.0), s=2, n=10, customers=100_000,
+                                 warmup=1000, replications=10, workers=2, seed=2, confidence=0.99)
+        self.assertWithin(estimate, q.mmsn(8.0, 3.0, 2, 10))
+
+    def test_md1(self):
+        # Pollaczek-Khinchine: nqueue = rho ** 2 / (2 * (1 - rho)) with deterministic service
+        estimate = sim.replicate(sim.exponential(0.8), sim.Variate('constant', 1.0), customers=100_000, warmup=1000,
+                                 replications=10, seed=3, confidence=0.99)
+        self.assertLessEqual(abs(estimate.nqueue.mean - 0.8 ** 2 / (2 * 0.2)), estimate.nqueue.half_width)
+        self.assertLessEqual(abs(estimate.po.mean - 0.2), estimate.po.half_width)
+
+    def test_invalid(self):
+        for warmup in (-1, 1000, 2000):
+            with self.assertRaises(ValueError):
+                sim.simulate(sim.exponential(1.0), sim.exponential(2.0), customers=1000, warmup=warmup)
+            with self.assertRaises(ValueError):
+                sim.replicate(sim.exponential(1.0), sim.exponential(2.0), customers=1000, warmup=warmup)
+        with self.assertRaises(ValueError):
+            sim.replicate(sim.exponential(1.0), sim.exponential(2.0), customers=1000, replications=1)
+
+
+if __name__ == '__main__':
+    unittest.main()